@@ -0,0 +1,235 @@
+import json
+import hashlib
+import os
+import queue
+import struct
+import threading
+import numpy as np
+from flask import Blueprint, Response, request, abort, make_response, stream_with_context
+from get_data import DataContext, get_room_data, parse_window
+from hot_cache import hot_cache
+from live import live_hub
+from rooms import ROOMS, rooms_by_name
+from rules import ACTUATORS
+from downsample import downsample
+
+# JSON time-series API the dashboards draw their charts from. Every response
+# carries an ETag derived from the newest reading, so polling clients get a
+# 304 without any query beyond the MAX(ts) lookups.
+
+api = Blueprint("api", __name__, url_prefix="/api")
+
+default_points = 1000
+max_points_limit = 10000
+catch_up_limit = 1000
+# A closed stream is only noticed, and its slot below released, when the next
+# write fails, so keepalives are sent often enough to free slots quickly.
+keepalive_seconds = 4
+# Every open stream holds one of the worker's threads, so only this many may be
+# open at once; the rest of the threads stay free for page and API requests.
+# gunicorn.conf.py sets it from the thread count.
+max_streams = int(os.environ.get("MAX_STREAMS", 8))
+stream_retry_ms = 10000
+open_streams = threading.BoundedSemaphore(max_streams)
+
+
+def etag_for(ctx, room_names):
+    latest = "-".join(str(ts) for ts in ctx.latest_timestamps(room_names))
+    return hashlib.sha1(f"{latest}:{request.full_path}".encode()).hexdigest()
+
+
+def respond(payload, content_type, etag):
+    response = make_response(payload)
+    response.content_type = content_type
+    response.cache_control.no_cache = True
+    response.set_etag(etag)
+    return response
+
+
+def not_modified(etag):
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+def int_arg(name, default=None):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        abort(400, f"{name} must be an integer")
+
+
+# Binary columnar payload: little-endian uint32 header length, a JSON header
+# padded to 8 bytes ({"cursor", "fields": [{"name", "count"}...]}), then for
+# every field its float64 epoch-ms times followed by its float64 values.
+def encode_binary(columns, cursor):
+    header = json.dumps({"cursor": cursor, "fields": [{"name": name, "count": len(values)} for name, (times, values) in columns.items()]})
+    header = header.encode()
+    header += b" " * (-(4 + len(header)) % 8)
+    parts = [struct.pack("<I", len(header)), header]
+    for times, values in columns.values():
+        parts.append(np.asarray(times, dtype="<f8").tobytes())
+        parts.append(np.asarray(values, dtype="<f8").tobytes())
+    return b"".join(parts)
+
+
+@api.route("/<room_name>/series")
+def series(room_name):
+    room = rooms_by_name.get(room_name)
+    if room is None:
+        abort(404)
+    fields = request.args.get("fields")
+    fields = fields.split(",") if fields else room.columns
+    unknown = [field for field in fields if field not in room.columns]
+    if unknown:
+        abort(400, f"Unknown fields {unknown}, {room_name} has {room.columns}")
+    max_points = min(max(int_arg("max_points", default_points), 3), max_points_limit)
+    output = request.args.get("format", "json")
+    if output not in ("json", "binary"):
+        abort(400, "format must be json or binary")
+
+    ctx = DataContext(hot_cache)
+    etag = etag_for(ctx, (room_name,))
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
+    since = int_arg("since")
+    until = int_arg("until", ctx.now + 1)
+    window = request.args.get("window")
+    if window:
+        try:
+            since = until - parse_window(window) * 1000
+        except ValueError as e:
+            abort(400, str(e))
+    if since is None:
+        data = ctx.room(room_name, default_points, columnar=True)
+    else:
+        data = ctx.span(room_name, since, until, max_points)
+
+    # The ts of the newest reading served, to follow the stream from. The
+    # times of a min/max envelope are not reading times and can lie past it.
+    newest_ts = ctx.latest_timestamps((room_name,))[0]
+    cursor = newest_ts
+    if since is not None and newest_ts is not None and newest_ts >= until:
+        cursor = until - 1
+
+    columns = {}
+    for field in fields:
+        times, values = downsample(data, field, max_points)
+        columns[field] = (times.astype("datetime64[ms]").astype(np.int64), values)
+
+    if output == "binary":
+        return respond(encode_binary(columns, cursor), "application/octet-stream", etag)
+    payload = {"room": room_name, "cursor": cursor, "fields": {field: {"t": times.tolist(), "v": np.round(values, 2).tolist()}
+                                             for field, (times, values) in columns.items()}}
+    return respond(json.dumps(payload, separators=(",", ":")), "application/json", etag)
+
+
+@api.route("/latest")
+def latest():
+    ctx = DataContext(hot_cache)
+    etag = etag_for(ctx, [room.name for room in ROOMS])
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    return respond(json.dumps(ctx.latest_readings(), separators=(",", ":")), "application/json", etag)
+
+
+def sse(reading):
+    return f"id: {reading['ts']}\nevent: reading\ndata: {json.dumps(reading, separators=(',', ':'))}\n\n"
+
+
+# Actuator events carry no id, so they leave the stream's Last-Event-ID alone.
+def sse_actuator(name, state):
+    return f"event: actuator\ndata: {json.dumps({'actuator': name, 'state': state})}\n\n"
+
+
+# Last state every actuator confirmed, or null before it has reported one.
+@api.route("/actuators")
+def actuators():
+    live_hub.start()
+    states = {actuator.name: live_hub.actuator_states.get(actuator.name) for actuator in ACTUATORS}
+    response = make_response(json.dumps(states))
+    response.content_type = "application/json"
+    response.cache_control.no_cache = True
+    return response
+
+
+# Server-Sent Events stream of new readings, fed by the ingester through the
+# live hub. A reconnecting client (Last-Event-ID) or one passing ?since= first
+# gets the readings it missed from the database, then only live ones. The
+# confirmed actuator states are sent first and then whenever one changes.
+# Past max_streams open streams a client gets a 503 with a retry hint.
+@api.route("/stream")
+def stream():
+    names = request.args.get("rooms")
+    room_names = names.split(",") if names else [room.name for room in ROOMS]
+    unknown = [name for name in room_names if name not in rooms_by_name]
+    if unknown:
+        abort(400, f"Unknown rooms {unknown}")
+    since = request.headers.get("Last-Event-ID") or request.args.get("since")
+    try:
+        since = int(since) if since else None
+    except ValueError:
+        abort(400, "since must be an integer")
+
+    if not open_streams.acquire(blocking=False):
+        response = make_response(f"retry: {stream_retry_ms}\n\n", 503)
+        response.mimetype = "text/event-stream"
+        response.headers["Retry-After"] = str(stream_retry_ms // 1000)
+        return response
+
+    # Subscribe before reading the backlog so nothing committed in between is lost.
+    subscriber = live_hub.subscribe()
+    backlog = []
+    try:
+        if since is not None:
+            for name in room_names:
+                data = get_room_data(name, catch_up_limit, columnar=True, since_ts=since)
+                columns = rooms_by_name[name].columns
+                for i in range(len(data)):
+                    reading = {column: float(data[column][i]) for column in columns}
+                    reading["room"] = name
+                    reading["ts"] = int(data.ts[i])
+                    backlog.append(reading)
+            backlog.sort(key=lambda reading: reading["ts"])
+    except BaseException:
+        live_hub.unsubscribe(subscriber)
+        open_streams.release()
+        raise
+    caught_up_to = backlog[-1]["ts"] if backlog else since or 0
+    wanted = set(room_names)
+
+    def events():
+        try:
+            yield "retry: 5000\n\n"
+            for name, state in list(live_hub.actuator_states.items()):
+                yield sse_actuator(name, state)
+            for reading in backlog:
+                yield sse(reading)
+            while True:
+                try:
+                    reading = subscriber.get(timeout=keepalive_seconds)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if reading is None:
+                    return
+                if "actuator" in reading:
+                    yield sse_actuator(reading["actuator"], reading["state"])
+                elif reading["room"] in wanted and reading["ts"] > caught_up_to:
+                    yield sse(reading)
+        finally:
+            live_hub.unsubscribe(subscriber)
+
+    response = Response(stream_with_context(events()), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # Runs however the response ends, even if the generator never started.
+    response.call_on_close(open_streams.release)
+    return response
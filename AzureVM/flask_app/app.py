@@ -1,379 +1,169 @@
-import base64
-from io import BytesIO
-from matplotlib.figure import Figure
-import matplotlib.colors as mcolors
-from flask import Flask, render_template, redirect, url_for, request, session
+from flask import Flask, render_template, redirect, url_for, request, session, abort, make_response, jsonify
 from get_data import *
+import os
 import secrets
-import paho.mqtt.publish as publish
+import threading
+from migrate_db import migrate
+from chart_cache import cached_chart
+from downsample import downsample
+from api import api
+from hot_cache import hot_cache
+from live import live_hub
+from render_pool import render_pool
+from publisher import publisher
+from rules import actuators_by_name
+import charts
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(16)
-app.run(debug=True)
+# Shared by every worker so sessions survive being served by another one;
+# gunicorn.conf.py sets it once in the master when it isn't configured.
+app.secret_key = os.environ.get("SECRET_KEY") or secrets.token_hex(16)
+app.register_blueprint(api)
 datapoints = 1000
-num_ticks = 20
-
-def bath_temp():
-    timestamps, temp, hum, bat = get_bath_data(datapoints)
-   
-    fig = Figure() 
-    ax1 = fig.add_subplot(2, 1, 1)
-    fig.subplots_adjust(bottom=0.1)
-    ax1.set_facecolor("white")
-    ax1.plot(timestamps, temp, linestyle="solid", c="#11f", linewidth="1.5")
-    ax1.set_ylabel("Temp in C")
-    ax1.tick_params(axis="y", colors="blue")
-    ax1.spines["left"].set_color("blue")
-    tick_positions = range(0, len(timestamps), len(timestamps) // num_ticks)
-    ax1.set_xticks(tick_positions)
-    ax1.set_xticklabels([])
-    ax1.grid(axis='y', linestyle='--')
-
-    ax2 = fig.add_subplot(2, 1, 2)
-    ax2.tick_params(axis='x', which='both', rotation=90)
-    ax2.set_facecolor("white")
-    ax2.plot(timestamps, hum, linestyle="solid", c="#11f", linewidth="1.5")
-    ax2.set_xlabel("Timestamps")
-    ax2.set_ylabel("Humidity in %")
-    ax2.tick_params(axis="x", colors="black")
-    ax2.tick_params(axis="y", colors="blue")
-    ax2.spines["left"].set_color("blue")
-    tick_positions = range(0, len(timestamps), len(timestamps) // num_ticks)
-    ax2.set_xticks(tick_positions)
-    ax2.grid(axis='y', linestyle='--')
-    
-    fig.subplots_adjust(bottom=0.3)
-    fig.patch.set_facecolor("orange")
-    buf = BytesIO()
-    fig.savefig(buf, format="png")
-    data = base64.b64encode(buf.getbuffer()).decode("ascii")
-    return data
-
-def bedroom_temp():
-    timestamps, temp, hum, bat = get_bedroom_data(datapoints)
-   
-    fig = Figure() 
-    ax1 = fig.add_subplot(2, 1, 1)
-    fig.subplots_adjust(bottom=0.1)
-    ax1.set_facecolor("white")
-    ax1.plot(timestamps, temp, linestyle="solid", c="#11f", linewidth="1.5")
-    ax1.set_ylabel("Temp in C")
-    ax1.tick_params(axis="y", colors="blue")
-    ax1.spines["left"].set_color("blue") 
-    tick_positions = range(0, len(timestamps), len(timestamps) // num_ticks)
-    ax1.set_xticks(tick_positions)
-    ax1.set_xticklabels([])
-    ax1.grid(axis='y', linestyle='--')
-
-    ax2 = fig.add_subplot(2, 1, 2)
-    ax2.tick_params(axis='x', which='both', rotation=90)
-    ax2.set_facecolor("white")
-    ax2.plot(timestamps, hum, linestyle="solid", c="#11f", linewidth="1.5")
-    ax2.set_xlabel("Timestamps")
-    ax2.set_ylabel("Humidity in %")
-    ax2.tick_params(axis="x", colors="black")
-    ax2.tick_params(axis="y", colors="blue") 
-    ax2.spines["left"].set_color("blue")
-    tick_positions = range(0, len(timestamps), len(timestamps) // num_ticks)
-    ax2.set_xticks(tick_positions)
-    ax2.grid(axis='y', linestyle='--')
-    
-    fig.subplots_adjust(bottom=0.3)
-    fig.patch.set_facecolor("orange")
-    buf = BytesIO()
-    fig.savefig(buf, format="png")
-    data = base64.b64encode(buf.getbuffer()).decode("ascii")
-    return data
-
-def stue_temp():
-    timestamps, temp, hum, tvoc, part, co2 = get_stue_data(datapoints)
-   
-    fig = Figure() 
-    ax1 = fig.add_subplot(2, 1, 1)
-    fig.subplots_adjust(bottom=0.1)
-    ax1.set_facecolor("white")
-    ax1.plot(timestamps, temp, linestyle="solid", c="#11f", linewidth="1.5")
-    ax1.set_ylabel("Temp in C")
-    ax1.tick_params(axis="y", colors="blue")
-    ax1.spines["left"].set_color("blue")
-    tick_positions = range(0, len(timestamps), len(timestamps) // num_ticks)
-    ax1.set_xticks(tick_positions) 
-    ax1.set_xticklabels([])
-    ax1.grid(axis='y', linestyle='--')
-
-    ax2 = fig.add_subplot(2, 1, 2)
-    ax2.tick_params(axis='x', which='both', rotation=90)
-    ax2.set_facecolor("white")
-    ax2.plot(timestamps, hum, linestyle="solid", c="#11f", linewidth="1.5")
-    ax2.set_xlabel("Timestamps")
-    ax2.set_ylabel("Humidity in %")
-    ax2.tick_params(axis="x", colors="black")
-    ax2.tick_params(axis="y", colors="blue")
-    ax2.spines["left"].set_color("blue")
-    tick_positions = range(0, len(timestamps), len(timestamps) // num_ticks)
-    ax2.set_xticks(tick_positions)
-    ax2.grid(axis='y', linestyle='--')
-    
-    fig.subplots_adjust(bottom=0.3)
-    fig.patch.set_facecolor("orange")
-    buf = BytesIO()
-    fig.savefig(buf, format="png")
-    data = base64.b64encode(buf.getbuffer()).decode("ascii")
-    return data
-
-def stue_data_co2_tvoc_part():
-    timestamps, temp, hum, tvoc, part, co2 = get_stue_data(datapoints)
-    
-    fig = Figure() 
-    ax1 = fig.add_subplot(2, 1, 1)
-    fig.subplots_adjust(bottom=0.1)
-    ax1.set_facecolor("white")
-    ax1.plot(timestamps, tvoc, linestyle="solid", c="#11f", linewidth="1.5")
-    ax1.set_ylabel("TVOC in ppb")
-    ax1.tick_params(axis="y", colors="blue")
-    ax1.spines["left"].set_color("blue")
-    tick_positions = range(0, len(timestamps), len(timestamps) // num_ticks)
-    ax1.set_xticks(tick_positions) 
-    ax1.set_xticklabels([])
-    ax1.grid(axis='y', linestyle='--')
-
-    ax2 = fig.add_subplot(2, 1, 2)
-    ax2.tick_params(axis='x', which='both', rotation=90)
-    ax2.set_facecolor("white")
-    ax2.plot(timestamps, co2, linestyle="solid", c="#11f", linewidth="1.5")
-    ax2.set_xlabel("Timestamps")
-    ax2.set_ylabel("CO2 in ppm")
-    ax2.tick_params(axis="x", colors="black")
-    ax2.tick_params(axis="y", colors="blue")
-    ax2.spines["left"].set_color("blue")
-    tick_positions = range(0, len(timestamps), len(timestamps) // num_ticks)
-    ax2.set_xticks(tick_positions)
-    ax2.grid(axis='y', linestyle='--')
-    
-    fig.subplots_adjust(bottom=0.3)
-    fig.patch.set_facecolor("orange")
-    buf = BytesIO()
-    fig.savefig(buf, format="png")
-    data = base64.b64encode(buf.getbuffer()).decode("ascii")
-    return data
-
-def part_in_air():
-    timestamps, temp, hum, tvoc, part, co2 = get_stue_data(datapoints)
-
-    fig = Figure()
-    ax = fig.subplots()
-    fig.subplots_adjust(bottom=0.3)
-    
-    ax.tick_params(axis='x', which='both', rotation=90)
-    ax.set_facecolor("white")
-    ax.plot(timestamps, part, linestyle="solid", c="#11f", linewidth="1.5")
-    ax.set_xlabel("Timestamps")
-    ax.set_ylabel("particles in µg/m³")
-    ax.tick_params(axis="x", colors="black")
-    ax.tick_params(axis="y", colors="blue")
-    ax.spines["left"].set_color("blue")
-    ax.grid(axis='y', linestyle='--')
-    tick_positions = range(0, len(timestamps), len(timestamps) // num_ticks)
-    ax.set_xticks(tick_positions)
-    fig.patch.set_facecolor("orange")
-    
-    buf = BytesIO()
-    fig.savefig(buf, format="png")
-    data = base64.b64encode(buf.getbuffer()).decode("ascii")
-    return data
-
-def bat_stat():
-    timestamps, temp, hum, bat1 = get_bath_data(1)
-    timestamps, temp, hum, bat2 = get_bedroom_data(1)
-    
-    fig = Figure(figsize=(3,6))
-    
-    bath_esp = bat1[0]
-    bed_esp = bat2[0]
-    x = 1
-    ax1, ax2 = fig.subplots(2, 1)
-    fig.subplots_adjust(left=0.5, right=0.6)
-
-    ax1.bar(x, bed_esp, width=1, edgecolor="white", linewidth=0.7)
-    ax1.set(xlim=(1, 1), xticks=list(range(1, 1)),
-            ylim=(0, 4), yticks=list(range(0, 101, 25)))
-    ax1.bar_label(ax1.containers[0], fmt='%d', padding=3)
-    ax1.set_title("ESP Bed Bat")
-
-    ax2.bar(x, bath_esp, width=1, edgecolor="white", linewidth=0.7)
-    ax2.set(xlim=(1, 1), xticks=list(range(1, 1)),
-            ylim=(0, 4), yticks=list(range(0, 101, 25)))
-    ax2.bar_label(ax2.containers[0], fmt='%d', padding=3)
-    ax2.set_title("ESP Bath Bat")
-
-    fig.tight_layout()
-    buf = BytesIO()
-    fig.savefig(buf, format="png")
-    data = base64.b64encode(buf.getbuffer()).decode("ascii")
-    return data
-
-def humidity_realtime():
-    timestamps, temp, hum1, bat = get_bath_data(1)
-    timestamps, temp, hum2, bat = get_bedroom_data(1)
-    timestamps, temp, hum3, tvoc, part, co2 = get_stue_data(1)
-    
-    fig = Figure(figsize=(3,6))
-   
-    hum1 = [hum1[0]]
-    hum2 = [hum2[0]]
-    hum3 = [hum3[0]]
-    x = 1
-    ax1, ax2, ax3 = fig.subplots(3, 1)
-    fig.subplots_adjust(left=0.5, right=0.6)
-
-    colors = [(0, 'green'), (0.5, 'yellow'), (1, 'red')]
-    custom_cmap = mcolors.LinearSegmentedColormap.from_list('custom', colors)
-
-    ax1.bar(x, hum1, width=1, edgecolor="white", linewidth=0.7,  color=custom_cmap(hum1))
-    ax1.set(xlim=(1, 1), xticks=list(range(1, 1)),
-            ylim=(0, 4), yticks=list(range(0, 101, 25)))
-    ax1.bar_label(ax1.containers[0], fmt='%d', padding=3)
-    ax1.set_title("Humidity Bath")
-
-    ax2.bar(x, hum2, width=1, edgecolor="white", linewidth=0.7,  color=custom_cmap(hum1))
-    ax2.set(xlim=(1, 1), xticks=list(range(1, 1)),
-            ylim=(0, 4), yticks=list(range(0, 101, 25)))
-    ax2.bar_label(ax2.containers[0], fmt='%d', padding=3)
-    ax2.set_title("Humidity Bedroom")
-    
-    ax3.bar(x, hum3, width=1, edgecolor="white", linewidth=0.7,  color=custom_cmap(hum1))
-    ax3.set(xlim=(1, 1), xticks=list(range(1, 1)),
-            ylim=(0, 4), yticks=list(range(0, 101, 25)))
-    ax3.bar_label(ax3.containers[0], fmt='%d', padding=3)
-    ax3.set_title("Humidity Stue")
-
-    buf = BytesIO()
-    fig.savefig(buf, format="png")
-    data = base64.b64encode(buf.getbuffer()).decode("ascii")
-    return data
-
-def temp_realtime():
-    timestamps, temp1, hum1, bat = get_bath_data(1)
-    timestamps, temp2, hum2, bat = get_bedroom_data(1)
-    timestamps, temp3, hum3, tvoc, part, co2 = get_stue_data(1)
-
-    fig = Figure(figsize=(3,6))
-    measurement = 18
-    temp1 = [temp1[0]]
-    temp2 = [temp2[0]]
-    temp3 = [temp3[0]]
-    x = 1
-    ax1, ax2, ax3 = fig.subplots(3, 1)
-
-    fig.subplots_adjust(left=0.5, right=0.6)   
-
-    ax1.bar(x, temp1, width=1, edgecolor="white", linewidth=0.7)
-    ax1.set(xlim=(1, 1), xticks=list(range(1, 1)),
-            ylim=(0, 4), yticks=list(range(10, 41, 10)))
-    ax1.bar_label(ax1.containers[0], fmt='%d', padding=3)
-    ax1.set_title("Temperature Bath")
-
-    ax2.bar(x, temp2, width=1, edgecolor="white", linewidth=0.7)
-    ax2.set(xlim=(1, 1), xticks=list(range(1, 1)),
-            ylim=(0, 4), yticks=list(range(10, 41, 10)))
-    ax2.bar_label(ax2.containers[0], fmt='%d', padding=3)
-    ax2.set_title("Temperature Bedroom")
-
-    ax3.bar(x, temp3, width=1, edgecolor="white", linewidth=0.7)
-    ax3.set(xlim=(1, 1), xticks=list(range(1, 1)),
-            ylim=(0, 4), yticks=list(range(10, 41, 10)))
-    ax3.bar_label(ax3.containers[0], fmt='%d', padding=3)
-    ax3.set_title("Temperature Stue")
-
-    buf = BytesIO()
-    fig.savefig(buf, format="png")
-    data = base64.b64encode(buf.getbuffer()).decode("ascii")
-    return data
-
-def Tvoc_co2__particle_real():
-    timestamps, temp3, hum3, tvoc, part, co2 = get_stue_data(1)
-
-    fig = Figure(figsize=(3,6))
-    measurement = 18
-    tvoc = [tvoc[0]]
-    co2 = [co2[0]]
-    pm = [part[0]]
-    x = 1
-    ax1, ax2, ax3 = fig.subplots(3, 1)
-    
-    fig.subplots_adjust(left=0.5, right=0.6)
-
-    ax1.bar(x, tvoc, width=1, edgecolor="white", linewidth=0.7)
-    ax1.set(xlim=(1, 1), xticks=list(range(1, 1)),
-            ylim=(0, 4), yticks=list(range(0, 2001, 500)))
-    ax1.bar_label(ax1.containers[0], fmt='%d', padding=3)
-    ax1.set_title("Tvoc")
-
-    ax2.bar(x, co2, width=1, edgecolor="white", linewidth=0.7)
-    ax2.set(xlim=(1, 1), xticks=list(range(1, 1)),
-            ylim=(0, 4), yticks=list(range(0, 4001, 500)))
-    ax2.bar_label(ax2.containers[0], fmt='%d', padding=3)
-    ax2.set_title("CO2")
-
-    ax3.bar(x, part, width=1, edgecolor="white", linewidth=0.7)
-    ax3.set(xlim=(1, 1), xticks=list(range(1, 1)),
-            ylim=(0, 4), yticks=list(range(0, 20, 2)))
-    ax3.bar_label(ax3.containers[0], fmt='%d', padding=3)
-    ax3.set_title("Particles")
-
-    buf = BytesIO()
-    fig.savefig(buf, format="png")
-    data = base64.b64encode(buf.getbuffer()).decode("ascii")
-    return data
+max_resolution = 10000
+min_dpi = 30
+max_dpi = 300
+
+
+# Reads ?window=7d&resolution=800 from the request. Without a window the room
+# pages show the newest `datapoints` readings; resolution is the maximum number
+# of points drawn per line, so long windows are downsampled to the chart width.
+def view_args():
+    window = request.args.get("window")
+    seconds = None
+    if window:
+        try:
+            seconds = parse_window(window)
+        except ValueError as e:
+            abort(400, str(e))
+    resolution = request.args.get("resolution", default=datapoints, type=int)
+    return seconds, min(max(resolution, 3), max_resolution)
+
+
+# Reads ?dpi=150 for the image encoding of `fmt`; without it charts are drawn
+# at their figure's DPI. SVG has no DPI, so it never splits the chart cache.
+def image_args(fmt):
+    dpi = request.args.get("dpi", type=int)
+    if dpi is not None and fmt != "svg":
+        dpi = min(max(dpi, min_dpi), max_dpi)
+    else:
+        dpi = None
+    return fmt, dpi
+
+
+def history(ctx, room_name, window, resolution):
+    if window is None:
+        return ctx.room(room_name, datapoints, columnar=True)
+    return ctx.window(room_name, window, resolution)
+
+
+# Downsampled (time, values) of the given columns of a room's history view,
+# the plain data the history renderers in charts.py take.
+def history_columns(ctx, room_name, window, resolution, columns):
+    series = history(ctx, room_name, window, resolution)
+    return {column: downsample(series, column, resolution) for column in columns}
+
+
+@cached_chart(("bath",))
+def bath_temp(ctx, window=None, resolution=None, fmt="png", dpi=None):
+    return render_pool.render(charts.render, "bath_temp", history_columns(ctx, "bath", window, resolution, ("temperature", "humidity")), fmt, dpi)
+
+@cached_chart(("bedroom",))
+def bedroom_temp(ctx, window=None, resolution=None, fmt="png", dpi=None):
+    return render_pool.render(charts.render, "bedroom_temp", history_columns(ctx, "bedroom", window, resolution, ("temperature", "humidity")), fmt, dpi)
+
+@cached_chart(("stue",))
+def stue_temp(ctx, window=None, resolution=None, fmt="png", dpi=None):
+    return render_pool.render(charts.render, "stue_temp", history_columns(ctx, "stue", window, resolution, ("temperature", "humidity")), fmt, dpi)
+
+@cached_chart(("stue",))
+def stue_data_co2_tvoc_part(ctx, window=None, resolution=None, fmt="png", dpi=None):
+    return render_pool.render(charts.render, "stue_data_co2_tvoc_part", history_columns(ctx, "stue", window, resolution, ("tvoc", "co2")), fmt, dpi)
+
+@cached_chart(("stue",))
+def part_in_air(ctx, window=None, resolution=None, fmt="png", dpi=None):
+    return render_pool.render(charts.render, "part_in_air", history_columns(ctx, "stue", window, resolution, ("particles",)), fmt, dpi)
+
+@cached_chart(("bath", "bedroom"))
+def bat_stat(ctx, fmt="png", dpi=None):
+    return render_pool.render(charts.render, "bat_stat", ctx.latest_readings(), fmt, dpi)
+
+@cached_chart(("bath", "bedroom", "stue"))
+def humidity_realtime(ctx, fmt="png", dpi=None):
+    return render_pool.render(charts.render, "humidity_realtime", ctx.latest_readings(), fmt, dpi)
+
+@cached_chart(("bath", "bedroom", "stue"))
+def temp_realtime(ctx, fmt="png", dpi=None):
+    return render_pool.render(charts.render, "temp_realtime", ctx.latest_readings(), fmt, dpi)
+
+@cached_chart(("stue",))
+def Tvoc_co2__particle_real(ctx, fmt="png", dpi=None):
+    return render_pool.render(charts.render, "Tvoc_co2__particle_real", ctx.latest_readings(), fmt, dpi)
 
 @app.route('/')
 def home():
     return render_template('index.html')
 
+# Server-rendered charts, kept as image endpoints for browsers without
+# JavaScript. The pages themselves draw their charts from the JSON API.
+history_charts = {chart.__name__: chart for chart in
+                  [bath_temp, bedroom_temp, stue_temp, stue_data_co2_tvoc_part, part_in_air]}
+realtime_charts = {chart.__name__: chart for chart in
+                   [bat_stat, humidity_realtime, temp_realtime, Tvoc_co2__particle_real]}
+
+@app.route('/chart/<name>.<any(png, webp, svg):fmt>')
+def chart(name, fmt):
+    ctx = DataContext(hot_cache)
+    if name in history_charts:
+        data = history_charts[name](ctx, *view_args(), *image_args(fmt))
+    elif name in realtime_charts:
+        data = realtime_charts[name](ctx, *image_args(fmt))
+    else:
+        abort(404)
+    response = make_response(data)
+    response.content_type = charts.FORMATS[fmt]
+    response.cache_control.no_cache = True
+    response.add_etag()
+    return response.make_conditional(request)
+
 @app.route('/mqtt')
 def mqtt():
-    esp_bat_stat = bat_stat()
-    humidity = humidity_realtime()
-    temperature = temp_realtime()
-    Tvoc = Tvoc_co2__particle_real()
-    return render_template('mqtt.html', esp_bat_stat=esp_bat_stat, humidity=humidity, 
-                           temperature=temperature, Tvoc=Tvoc,)
+    return render_template('mqtt.html')
 
 @app.route('/bath')
 def bath():
-    bath_data = bath_temp()
-    return render_template('bath.html', bath_data=bath_data)
+    return render_template('bath.html')
 
 @app.route('/bedroom')
 def bedroom():
-    bedgraph_data = bedroom_temp()
-    return render_template('bedroom.html', bedgraph_data=bedgraph_data)
+    return render_template('bedroom.html')
 
 @app.route('/livingroom')
 def livingroom():
-    stue_temperature = stue_temp()
-    stue_data = stue_data_co2_tvoc_part()
-    part_air = part_in_air()
-    return render_template('livingroom.html', stue_temperature=stue_temperature, 
-                           stue_data=stue_data, part_air=part_air)
+    return render_template('livingroom.html')
+
+# Fan commands go out on the worker's persistent publisher without waiting
+# for the broker's acknowledgement. The request only acknowledges that the
+# command was sent: scripts asking for JSON get a 202, forms are redirected
+# back to the dashboard, and the state the fan confirms arrives over the
+# /api/stream "actuator" events.
+def fan_command(state):
+    fan = actuators_by_name["stue_fan"]
+    try:
+        publisher.publish(fan.topic, fan.on_payload if state else fan.off_payload)
+    except ConnectionError as e:
+        abort(503, str(e))
+    if request.accept_mimetypes.best_match(["text/html", "application/json"]) == "application/json":
+        return jsonify(actuator=fan.name, state=state, sent=True), 202
+    return redirect(url_for('livingroom'), 303)
 
 @app.route('/taend/', methods=['POST', 'GET'])
 def taend():
-    publish.single("sensor/stue/fan", "1", hostname="localhost")
-    stue_temperature = stue_temp()
-    stue_data = stue_data_co2_tvoc_part()
-    part_air = part_in_air()
-    return render_template('livingroom.html', stue_temperature=stue_temperature, 
-                           stue_data=stue_data, part_air=part_air)
+    return fan_command(True)
 
 @app.route('/sluk/', methods=['POST', 'GET'])
 def sluk():
-    publish.single("sensor/stue/fan", "0", hostname="localhost")
-    stue_temperature = stue_temp()
-    stue_data = stue_data_co2_tvoc_part()
-    part_air = part_in_air()
-    return render_template('livingroom.html', stue_temperature=stue_temperature, 
-                           stue_data=stue_data, part_air=part_air)
+    return fan_command(False)
 
 @app.route('/config')
 def config():
@@ -400,3 +190,37 @@ def login():
         
         conn.close()
     return render_template('login.html', error=error)
+
+
+# Renders the default view of every chart once, so the first visitors of a
+# fresh worker get them from the chart cache.
+def warm_caches():
+    live_hub.connected.wait(10)
+    ctx = DataContext(hot_cache)
+    try:
+        for chart in realtime_charts.values():
+            chart(ctx, "webp")
+        for chart in history_charts.values():
+            chart(ctx, None, datapoints, "webp")
+    except Exception as e:
+        print(f"Warming chart cache failed: {e}")
+
+
+# Per-process startup, called once in every serving worker (gunicorn runs
+# "app:create_app()", see gunicorn.conf.py). The gunicorn master migrates the
+# schema before the workers start, not here. The ingester and the fan
+# controller migrate at their own startup; migrate() serializes them on the
+# database's write lock.
+def create_app(warm=True):
+    hot_cache.start()
+    render_pool.start()
+    publisher.start()
+    if warm:
+        threading.Thread(target=warm_caches, daemon=True).start()
+    return app
+
+
+# Development server only: gunicorn -c gunicorn.conf.py serves production.
+if __name__ == "__main__":
+    migrate()
+    create_app(warm=False).run(debug=True, threaded=True)
@@ -0,0 +1,209 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import zlib
+from migrate_db import DB_PATH
+
+# Incremental backups of data.db into a content-addressed chunk store:
+#
+#   <target>/chunks/ab/abcdef...   zlib-compressed chunk, named by the SHA-256
+#                                  of its uncompressed content
+#   <target>/snapshots/<time>.json the ordered chunk list of one backup, named
+#                                  by its UTC start time to the millisecond
+#
+# A backup copies the live database with SQLite's online backup API, which is
+# consistent while log_data.py keeps writing and, unlike VACUUM INTO, keeps
+# every page where it was. The copy is cut into page-aligned chunks, so only
+# chunks holding pages that changed since any earlier backup are new; all the
+# others are already in the store. Chunks are never rewritten, which lets
+# backup-script.sh mirror the target with `rclone copy` and only upload what
+# is new. Restoring concatenates the chunks of a snapshot and checks them.
+#
+#   python backup.py backup --target /mnt/backup
+#   python backup.py list --target /mnt/backup
+#   python backup.py restore --target /mnt/backup --out restored.db
+#   python backup.py prune --target /mnt/backup --keep 30
+
+
+def chunk_path(target, digest):
+    return os.path.join(target, "chunks", digest[:2], digest)
+
+
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+
+# Like write_atomic, but raises FileExistsError instead of replacing a file
+# that is already there.
+def write_new(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temporary = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    try:
+        os.link(temporary, path)
+    finally:
+        os.remove(temporary)
+
+
+def snapshots(target):
+    directory = os.path.join(target, "snapshots")
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-len(".json")] for name in os.listdir(directory) if name.endswith(".json"))
+
+
+def load_snapshot(target, name):
+    with open(os.path.join(target, "snapshots", f"{name}.json")) as f:
+        return json.load(f)
+
+
+# Consistent copy of the database at `path` in a temporary file next to it.
+def copy_database(path):
+    fd, copy = tempfile.mkstemp(suffix=".backup", dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    destination = sqlite3.connect(copy)
+    try:
+        source.backup(destination)
+        page_size = destination.execute("PRAGMA page_size").fetchone()[0]
+    except sqlite3.Error as sql_e:
+        print(f"sqlite error occurred: {sql_e}")
+        os.remove(copy)
+        raise
+    finally:
+        destination.close()
+        source.close()
+    return copy, page_size
+
+
+def backup(path, target, chunk_pages, level):
+    start = time.perf_counter()
+    copy, page_size = copy_database(path)
+    chunk_size = page_size * chunk_pages
+    chunks = []
+    new_chunks = 0
+    new_bytes = 0
+    whole = hashlib.sha256()
+    try:
+        with open(copy, "rb") as f:
+            while True:
+                data = f.read(chunk_size)
+                if not data:
+                    break
+                whole.update(data)
+                digest = hashlib.sha256(data).hexdigest()
+                chunks.append(digest)
+                destination = chunk_path(target, digest)
+                if not os.path.exists(destination):
+                    compressed = zlib.compress(data, level)
+                    write_atomic(destination, compressed)
+                    new_chunks += 1
+                    new_bytes += len(compressed)
+        size = os.path.getsize(copy)
+    finally:
+        os.remove(copy)
+
+    # Milliseconds in the name, so backups started in the same second do not
+    # collide; write_new refuses to overwrite a snapshot should they anyway.
+    now = time.time()
+    name = time.strftime("%Y%m%dT%H%M%S", time.gmtime(now)) + f"{int(now * 1000) % 1000:03d}Z"
+    snapshot = {"created": name, "database": os.path.basename(path), "size": size, "page_size": page_size,
+                "chunk_size": chunk_size, "sha256": whole.hexdigest(), "chunks": chunks}
+    write_new(os.path.join(target, "snapshots", f"{name}.json"), json.dumps(snapshot).encode())
+    print(f"snapshot {name}: {size / 1e6:.1f} MB in {len(chunks)} chunks, {new_chunks} new "
+          f"({new_bytes / 1e6:.2f} MB stored) in {time.perf_counter() - start:.1f} s")
+    return name
+
+
+def restore(target, name, out, force=False):
+    if os.path.exists(out) and not force:
+        raise FileExistsError(f"{out} exists, pass --force to replace it")
+    snapshot = load_snapshot(target, name)
+    whole = hashlib.sha256()
+    with open(out + ".tmp", "wb") as f:
+        for digest in snapshot["chunks"]:
+            with open(chunk_path(target, digest), "rb") as chunk:
+                data = zlib.decompress(chunk.read())
+            if hashlib.sha256(data).hexdigest() != digest:
+                raise ValueError(f"Chunk {digest} is corrupt")
+            whole.update(data)
+            f.write(data)
+    if whole.hexdigest() != snapshot["sha256"]:
+        os.remove(out + ".tmp")
+        raise ValueError(f"Restored database does not match snapshot {name}")
+    conn = sqlite3.connect(out + ".tmp")
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+    if result != "ok":
+        os.remove(out + ".tmp")
+        raise ValueError(f"Restored database failed its integrity check: {result}")
+    os.replace(out + ".tmp", out)
+    print(f"restored snapshot {name} to {out} ({snapshot['size'] / 1e6:.1f} MB)")
+
+
+# Deletes all but the newest `keep` snapshots and the chunks only they used.
+def prune(target, keep):
+    names = snapshots(target)
+    dropped = names[:-keep] if keep else names
+    for name in dropped:
+        os.remove(os.path.join(target, "snapshots", f"{name}.json"))
+    used = {digest for name in snapshots(target) for digest in load_snapshot(target, name)["chunks"]}
+    removed = 0
+    chunks_dir = os.path.join(target, "chunks")
+    for prefix in os.listdir(chunks_dir) if os.path.isdir(chunks_dir) else []:
+        for digest in os.listdir(os.path.join(chunks_dir, prefix)):
+            if digest not in used:
+                os.remove(os.path.join(chunks_dir, prefix, digest))
+                removed += 1
+    print(f"dropped {len(dropped)} snapshots and {removed} chunks")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental, deduplicated backups of the sensor database")
+    parser.add_argument("--target", required=True, help="backup directory, mirrored to the remote by backup-script.sh")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backup_parser = commands.add_parser("backup", help="store a new snapshot of the database")
+    backup_parser.add_argument("--db", default=DB_PATH)
+    backup_parser.add_argument("--chunk-pages", type=int, default=64, help="database pages per chunk")
+    backup_parser.add_argument("--level", type=int, default=6, help="zlib compression level")
+
+    commands.add_parser("list", help="list the stored snapshots")
+
+    restore_parser = commands.add_parser("restore", help="rebuild a database file from a snapshot")
+    restore_parser.add_argument("--snapshot", default="latest")
+    restore_parser.add_argument("--out", required=True)
+    restore_parser.add_argument("--force", action="store_true", help="replace --out if it exists")
+
+    prune_parser = commands.add_parser("prune", help="drop old snapshots and their unused chunks")
+    prune_parser.add_argument("--keep", type=int, required=True, help="number of newest snapshots kept")
+    args = parser.parse_args()
+
+    if args.command == "backup":
+        backup(args.db, args.target, args.chunk_pages, args.level)
+    elif args.command == "list":
+        for name in snapshots(args.target):
+            snapshot = load_snapshot(args.target, name)
+            print(f"{name}  {snapshot['size'] / 1e6:8.1f} MB  {len(snapshot['chunks'])} chunks")
+    elif args.command == "restore":
+        names = snapshots(args.target)
+        if not names:
+            parser.error(f"no snapshots in {args.target}")
+        name = names[-1] if args.snapshot == "latest" else args.snapshot
+        restore(args.target, name, args.out, args.force)
+    else:
+        prune(args.target, args.keep)
+
+
+if __name__ == "__main__":
+    main()
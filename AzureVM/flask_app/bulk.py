@@ -0,0 +1,210 @@
+import argparse
+import itertools
+import json
+import os
+import sqlite3
+import time
+import numpy as np
+import db_writer
+import partitions
+import rollups
+from colfile import ColumnReader, ColumnWriter
+from get_data import parse_window
+from migrate_db import DB_PATH, migrate
+from rooms import ROOMS, rooms_by_name
+
+# Bulk export and import of the room tables in the columnar format of
+# colfile.py, one <room>.cols file per room plus a manifest.json.
+#
+#   python bulk.py export --out export/                  everything
+#   python bulk.py export --out week/ --since 7d         the last week
+#   python bulk.py export --out next/ --continue-from export/manifest.json
+#   python bulk.py import export/
+#
+# Exports read every room from one read transaction, which in WAL mode is a
+# consistent snapshot that never blocks log_data.py, and stream it in chunks
+# of --chunk-rows. The manifest records the newest ts exported per room, so
+# the next export can pick up from there.
+#
+# Imports insert in batches of --batch-size inside one transaction per file,
+# each reading into its monthly partition. Where a file only holds readings
+# newer than a partition (a restore into an empty database, or appending a
+# later export) its ts index is dropped for the load and rebuilt once at the
+# end; otherwise rows whose ts is already present are skipped. The rollups
+# covering the imported span are rebuilt.
+
+MANIFEST = "manifest.json"
+
+
+# "1718000000000" (epoch ms) or a window like "7d" counted back from now.
+def parse_since(text):
+    if text.isdigit():
+        return int(text)
+    return int((time.time() - parse_window(text)) * 1000)
+
+
+# False for rows with a NULL or text value, stored before ingest checked them.
+def is_reading(row):
+    return isinstance(row[1], int) and all(isinstance(value, (int, float)) for value in row[2:])
+
+
+def export_room(conn, room, path, since_ts, chunk_rows, level):
+    source = itertools.chain.from_iterable(conn.execute(partition.export_query, (since_ts,))
+                                           for partition in partitions.overlapping(conn, room, since_ts + 1))
+    dtype = np.dtype(room.record_fields)
+    newest_ts = None
+    with open(path + ".tmp", "wb") as f:
+        writer = ColumnWriter(f, room, level)
+        while True:
+            rows = list(itertools.islice(source, chunk_rows))
+            if not rows:
+                break
+            try:
+                records = np.fromiter((row[1:] for row in rows), dtype=dtype, count=len(rows))
+            except (ValueError, TypeError):
+                readings = [row for row in rows if is_reading(row)]
+                print(f"{room.name}: skipping {len(rows) - len(readings)} rows that are not readings")
+                rows = readings
+                if not rows:
+                    continue
+                records = np.fromiter((row[1:] for row in rows), dtype=dtype, count=len(rows))
+            writer.write_chunk([row[0] for row in rows], records["ts"],
+                               {column: records[column] for column in room.columns})
+            newest_ts = int(records["ts"][-1])
+    os.replace(path + ".tmp", path)
+    return writer.rows, newest_ts
+
+
+def export(path, out_dir, rooms, since_ts, continue_from, chunk_rows, level):
+    previous = {}
+    if continue_from:
+        with open(continue_from) as f:
+            previous = json.load(f)["rooms"]
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {"created": int(time.time() * 1000), "rooms": {}}
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        conn.execute("BEGIN")
+        for room in rooms:
+            start = time.perf_counter()
+            room_since = since_ts
+            if room.name in previous:
+                room_since = max(room_since, previous[room.name]["newest_ts"])
+            file_name = f"{room.name}.cols"
+            rows, newest_ts = export_room(conn, room, os.path.join(out_dir, file_name), room_since, chunk_rows, level)
+            size = os.path.getsize(os.path.join(out_dir, file_name))
+            print(f"{room.name}: {rows} rows, {size / 1e6:.2f} MB in {time.perf_counter() - start:.2f} s")
+            manifest["rooms"][room.name] = {"file": file_name, "rows": rows, "since_ts": room_since,
+                                            "newest_ts": room_since if newest_ts is None else newest_ts}
+        conn.rollback()
+    except sqlite3.Error as sql_e:
+        print(f"sqlite error occurred: {sql_e}")
+        raise
+    finally:
+        conn.close()
+    with open(os.path.join(out_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=1)
+
+
+def import_file(conn, path, batch_size, defer_index):
+    with open(path, "rb") as f:
+        reader = ColumnReader(f)
+        room = rooms_by_name.get(reader.header["room"])
+        if room is None or reader.header["columns"] != room.columns:
+            raise ValueError(f"{path}: columns {reader.header['columns']} do not match room {reader.header['room']!r}")
+        # Per partition loaded into, whether the load only appends to it.
+        appending = {}
+        loaded = 0
+        span = None
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for datetimes, ts, fields in reader:
+                if not len(ts):
+                    continue
+                ts_list = ts.tolist()
+                columns = [datetimes, ts_list] + [fields[column].tolist() for column in room.columns]
+                for partition, start, end in partitions.split(room, ts_list):
+                    if partition not in appending:
+                        conn.execute(partition.create_query)
+                        newest_ts = conn.execute(f"SELECT max(ts) FROM {partition.table}").fetchone()[0]
+                        appending[partition] = newest_ts is None or ts_list[start] > newest_ts
+                        if appending[partition] and defer_index:
+                            conn.execute(f"DROP INDEX IF EXISTS {partition.index_name}")
+                        else:
+                            conn.execute(partition.index_query)
+                    for i in range(start, end, batch_size):
+                        batch = zip(*(values[i:min(i + batch_size, end)] for values in columns))
+                        if appending[partition]:
+                            loaded += conn.executemany(partition.insert_query, batch).rowcount
+                        else:
+                            loaded += conn.executemany(partition.insert_new_query,
+                                                       (row + (row[1],) for row in batch)).rowcount
+                span = (span[0] if span else ts_list[0], ts_list[-1])
+            for partition in appending:
+                conn.execute(partition.index_query)
+            if span is not None:
+                rollups.rebuild_range(conn, room.name, span[0], span[1] + 1)
+        return room, loaded, span
+
+
+def import_files(path, files, batch_size, defer_index):
+    migrate(path)
+    conn = db_writer.connect(path)
+    try:
+        for file_path in files:
+            start = time.perf_counter()
+            room, loaded, span = import_file(conn, file_path, batch_size, defer_index)
+            print(f"{room.name}: {loaded} rows from {file_path} in {time.perf_counter() - start:.2f} s")
+    except sqlite3.Error as sql_e:
+        print(f"sqlite error occurred: {sql_e}")
+        raise
+    finally:
+        conn.close()
+
+
+# A directory means the files listed in its manifest.
+def expand(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            with open(os.path.join(path, MANIFEST)) as f:
+                manifest = json.load(f)
+            files += [os.path.join(path, room["file"]) for room in manifest["rooms"].values()]
+        else:
+            files.append(path)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk export and import of sensor readings in a compressed columnar format")
+    parser.add_argument("--db", default=DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="write room tables to <out>/<room>.cols")
+    export_parser.add_argument("--out", required=True, help="directory for the files and manifest.json")
+    export_parser.add_argument("--rooms", help="comma separated rooms, all by default")
+    export_parser.add_argument("--since", type=parse_since, default=0, help="epoch ms or a window like 7d")
+    export_parser.add_argument("--continue-from", help="manifest.json of an earlier export to continue after")
+    export_parser.add_argument("--chunk-rows", type=int, default=65536)
+    export_parser.add_argument("--level", type=int, default=6, help="zlib compression level")
+
+    import_parser = commands.add_parser("import", help="load .cols files or export directories")
+    import_parser.add_argument("paths", nargs="+")
+    import_parser.add_argument("--batch-size", type=int, default=10000)
+    import_parser.add_argument("--keep-index", action="store_true",
+                               help="keep the ts index during appending loads instead of rebuilding it")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        names = args.rooms.split(",") if args.rooms else [room.name for room in ROOMS]
+        unknown = [name for name in names if name not in rooms_by_name]
+        if unknown:
+            parser.error(f"unknown rooms {unknown}, expected some of {list(rooms_by_name)}")
+        export(args.db, args.out, [rooms_by_name[name] for name in names], args.since,
+               args.continue_from, args.chunk_rows, args.level)
+    else:
+        import_files(args.db, expand(args.paths), args.batch_size, not args.keep_index)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import inspect
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import wraps
+
+
+# LRU cache of rendered charts, capped by the total size of the cached data.
+# Entries are keyed by (chart, rooms, window, newest ts of those rooms), so a
+# chart is only re-rendered once a new reading has landed in one of its rooms.
+class ChartCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.pending = {}
+        self.coalesced = 0
+
+    def get(self, key):
+        with self.lock:
+            data = self.entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                key, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    # Returns the cached data for key, or renders it with render(). Concurrent
+    # misses on the same key are coalesced: the first caller renders and the
+    # others wait for its result, so N simultaneous viewers cause one render.
+    def get_or_render(self, key, render):
+        data = self.get(key)
+        if data is not None:
+            return data
+        with self.lock:
+            future = self.pending.get(key)
+            owner = future is None
+            if owner:
+                # The previous owner may have finished since get() missed.
+                data = self.entries.get(key)
+                if data is not None:
+                    return data
+                future = self.pending[key] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+        try:
+            data = render()
+            self.put(key, data)
+            future.set_result(data)
+            return data
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.pending[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+chart_cache = ChartCache()
+
+
+# Caches a chart function under its own name for the given rooms. The chart
+# function takes the request's get_data.DataContext followed by the arguments
+# that select its window (e.g. window and resolution), which are part of the key.
+# The arguments are bound to the function's signature with its defaults filled
+# in, so chart(ctx, "webp") and chart(ctx, "webp", None) share one entry.
+def cached_chart(rooms):
+    def decorator(render):
+        signature = inspect.signature(render)
+
+        @wraps(render)
+        def wrapper(ctx, *args, **kwargs):
+            bound = signature.bind(ctx, *args, **kwargs)
+            bound.apply_defaults()
+            window = tuple(bound.arguments.values())[1:]
+            key = (render.__name__, rooms, window, ctx.latest_timestamps(rooms))
+            return chart_cache.get_or_render(key, lambda: render(ctx, *window))
+        return wrapper
+    return decorator
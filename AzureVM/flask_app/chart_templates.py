@@ -0,0 +1,188 @@
+import threading
+from io import BytesIO
+import numpy as np
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.image import imsave
+import matplotlib.colors as mcolors
+from matplotlib.dates import AutoDateLocator, DateFormatter
+from dateutil import tz
+from migrate_db import TIME_FORMAT
+
+# The matplotlib side of charts.py, imported on the first render. Images are
+# PNG, lossless WebP or SVG (text kept as text, paths simplified), at the
+# figure's own DPI unless another is asked for.
+#
+# Every chart is a template: its figure, axes, labels and styling are built
+# once per process and kept, and a render only swaps in the new data. Line
+# charts rescale and save; bar charts have fixed axes, so their static
+# background is drawn once and only the bars are blitted on top of it.
+
+num_ticks = 20
+local_tz = tz.tzlocal()
+
+save_options = {"png": {}, "webp": {"pil_kwargs": {"lossless": True}}, "svg": {}}
+svg_style = {"svg.fonttype": "none", "path.simplify": True, "path.simplify_threshold": 0.5}
+
+
+def save(fig, fmt, dpi):
+    buf = BytesIO()
+    with matplotlib.rc_context(svg_style if fmt == "svg" else {}):
+        fig.savefig(buf, format=fmt, dpi=dpi or "figure", **save_options[fmt])
+    return buf.getvalue()
+
+
+# Real time axis: at most num_ticks ticks, labelled in local time with the same
+# format the datetime column is stored in.
+def time_axis(ax, labels=True):
+    ax.xaxis_date(tz=local_tz)
+    ax.xaxis.set_major_locator(AutoDateLocator(tz=local_tz, maxticks=num_ticks))
+    if labels:
+        ax.xaxis.set_major_formatter(DateFormatter(TIME_FORMAT, tz=local_tz))
+    else:
+        ax.tick_params(axis="x", labelbottom=False)
+
+
+# Stacked line panels sharing a time axis, labelled on the bottom panel only.
+# panels: [(column, ylabel), ...]
+class LineChart:
+    def __init__(self, panels):
+        self.panels = panels
+        self.fig = Figure()
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.axes = []
+        self.lines = []
+        for i, (column, ylabel) in enumerate(panels):
+            ax = self.fig.add_subplot(len(panels), 1, i + 1)
+            ax.set_facecolor("white")
+            line, = ax.plot([], [], linestyle="solid", c="#11f", linewidth="1.5")
+            ax.set_ylabel(ylabel)
+            ax.tick_params(axis="y", colors="blue")
+            ax.spines["left"].set_color("blue")
+            ax.grid(axis='y', linestyle='--')
+            if i == len(panels) - 1:
+                ax.tick_params(axis='x', which='both', rotation=90)
+                ax.set_xlabel("Timestamps")
+                ax.tick_params(axis="x", colors="black")
+                time_axis(ax)
+            else:
+                time_axis(ax, labels=False)
+            self.axes.append(ax)
+            self.lines.append(line)
+        self.fig.subplots_adjust(bottom=0.3)
+        self.fig.patch.set_facecolor("orange")
+        self.lock = threading.Lock()
+
+    def render(self, columns, fmt="png", dpi=None):
+        with self.lock:
+            for (column, ylabel), ax, line in zip(self.panels, self.axes, self.lines):
+                line.set_data(*columns[column])
+                ax.relim()
+                ax.autoscale_view()
+            return save(self.fig, fmt, dpi)
+
+
+# One single-bar panel per reading shown, e.g. the humidity of every room.
+# bars: [(room, column, title, yticks), ...]. With a colormap every bar gets
+# the colour of the first bar's value.
+class BarChart:
+    def __init__(self, bars, colormap=None, tight=False):
+        self.bars = bars
+        self.colormap = colormap
+        self.fig = Figure(figsize=(3, 6))
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.axes = self.fig.subplots(len(bars), 1)
+        self.fig.subplots_adjust(left=0.5, right=0.6)
+        self.containers = []
+        for ax, (room, column, title, yticks) in zip(self.axes, bars):
+            container = ax.bar(1, 0, width=1, edgecolor="white", linewidth=0.7)
+            # Bar and spines are left out of the background and blitted.
+            container.patches[0].set_animated(True)
+            for spine in ax.spines.values():
+                spine.set_animated(True)
+            ax.set(xlim=(1, 1), xticks=list(range(1, 1)),
+                   ylim=(0, 4), yticks=list(yticks))
+            ax.set_title(title)
+            self.containers.append(container)
+        if tight:
+            self.fig.tight_layout()
+        self.background = None
+        self.lock = threading.Lock()
+
+    def render(self, latest, fmt="png", dpi=None):
+        # A room without readings gets an empty, unlabelled bar.
+        values = [latest[room][column] if latest.get(room) is not None else None
+                  for room, column, title, yticks in self.bars]
+        with self.lock:
+            for container, value in zip(self.containers, values):
+                bar = container.patches[0]
+                bar.set_height(value or 0)
+                if self.colormap is not None:
+                    bar.set_facecolor(self.colormap(values[0] or 0))
+            if fmt != "svg" and dpi in (None, self.fig.dpi):
+                return self.blit(values, fmt)
+            # Other DPIs and SVG need a full draw, which includes animated artists.
+            labels = [ax.bar_label(container, labels=[bar_text(value)], padding=3)
+                      for ax, container, value in zip(self.axes, self.containers, values)]
+            try:
+                return save(self.fig, fmt, dpi)
+            finally:
+                for label in labels:
+                    label[0].remove()
+                # Saving leaves the canvas at the last DPI, so it is redrawn.
+                self.background = None
+
+    def blit(self, values, fmt):
+        if self.background is None:
+            self.canvas.draw()
+            self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.canvas.restore_region(self.background)
+        for ax, container, value in zip(self.axes, self.containers, values):
+            ax.draw_artist(container.patches[0])
+            for spine in ax.spines.values():
+                ax.draw_artist(spine)
+            for label in ax.bar_label(container, labels=[bar_text(value)], padding=3):
+                ax.draw_artist(label)
+                label.remove()
+        buf = BytesIO()
+        imsave(buf, np.asarray(self.canvas.buffer_rgba()), format=fmt, **save_options[fmt])
+        return buf.getvalue()
+
+
+def bar_text(value):
+    return "" if value is None else '%d' % value
+
+
+humidity_cmap = mcolors.LinearSegmentedColormap.from_list('custom', [(0, 'green'), (0.5, 'yellow'), (1, 'red')])
+
+# Layout of every chart by name, built on first use in each process.
+layouts = {
+    "bath_temp": lambda: LineChart([("temperature", "Temp in C"), ("humidity", "Humidity in %")]),
+    "bedroom_temp": lambda: LineChart([("temperature", "Temp in C"), ("humidity", "Humidity in %")]),
+    "stue_temp": lambda: LineChart([("temperature", "Temp in C"), ("humidity", "Humidity in %")]),
+    "stue_data_co2_tvoc_part": lambda: LineChart([("tvoc", "TVOC in ppb"), ("co2", "CO2 in ppm")]),
+    "part_in_air": lambda: LineChart([("particles", "particles in µg/m³")]),
+    "bat_stat": lambda: BarChart([("bedroom", "battery", "ESP Bed Bat", range(0, 101, 25)),
+                                  ("bath", "battery", "ESP Bath Bat", range(0, 101, 25))], tight=True),
+    "humidity_realtime": lambda: BarChart([("bath", "humidity", "Humidity Bath", range(0, 101, 25)),
+                                           ("bedroom", "humidity", "Humidity Bedroom", range(0, 101, 25)),
+                                           ("stue", "humidity", "Humidity Stue", range(0, 101, 25))],
+                                          colormap=humidity_cmap),
+    "temp_realtime": lambda: BarChart([("bath", "temperature", "Temperature Bath", range(10, 41, 10)),
+                                       ("bedroom", "temperature", "Temperature Bedroom", range(10, 41, 10)),
+                                       ("stue", "temperature", "Temperature Stue", range(10, 41, 10))]),
+    "Tvoc_co2__particle_real": lambda: BarChart([("stue", "tvoc", "Tvoc", range(0, 2001, 500)),
+                                                 ("stue", "co2", "CO2", range(0, 4001, 500)),
+                                                 ("stue", "particles", "Particles", range(0, 20, 2))]),
+}
+templates = {}
+templates_lock = threading.Lock()
+
+
+def render(name, data, fmt="png", dpi=None):
+    with templates_lock:
+        template = templates.get(name)
+        if template is None:
+            template = templates[name] = layouts[name]()
+    return template.render(data, fmt, dpi)
@@ -0,0 +1,15 @@
+# Chart renderers. They only take plain data (downsampled (time, values) per
+# column, or the latest readings) and return the encoded image, so they can run
+# in the render pool's worker processes without Flask or a database connection.
+#
+# Importing this module is cheap: matplotlib and the chart templates
+# (chart_templates.py) are only loaded by the first render in a process, so
+# the web app, the controllers and CLI tools start without paying for them.
+
+FORMATS = {"png": "image/png", "webp": "image/webp", "svg": "image/svg+xml"}
+
+
+# Renders the chart `name` from its data as fmt (one of FORMATS) at dpi.
+def render(name, data, fmt="png", dpi=None):
+    import chart_templates
+    return chart_templates.render(name, data, fmt, dpi)
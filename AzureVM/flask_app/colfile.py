@@ -0,0 +1,125 @@
+import json
+import struct
+import zlib
+import numpy as np
+
+# Compressed columnar file format for room readings, written and read in
+# chunks so neither side ever holds more than one chunk in memory.
+#
+#   MAGIC
+#   <u32 length> header JSON   {"version", "room", "table", "columns"}
+#   <u32 length> chunk JSON    {"rows", "blocks": [[name, encoding, size], ...]}
+#   <blocks of that chunk>
+#   ... more chunks until end of file
+#
+# Every block is one column of the chunk, zlib-compressed after an encoding
+# that makes it compress well, like Parquet's:
+#
+#   delta    int64 ts as differences from the previous reading
+#   shuffle  float64 values with their bytes transposed, so the slowly
+#            changing sign/exponent bytes of all values sit next to each other
+#   lines    the text datetime column, newline separated
+
+MAGIC = b"IKCOL\x01\n"
+LENGTH = struct.Struct("<I")
+VERSION = 1
+
+
+def encode_delta(values):
+    return np.diff(values, prepend=np.int64(0)).astype("<i8").tobytes()
+
+
+def decode_delta(data):
+    return np.cumsum(np.frombuffer(data, dtype="<i8"))
+
+
+def encode_shuffle(values):
+    return np.ascontiguousarray(values, dtype="<f8").view(np.uint8).reshape(-1, 8).T.tobytes()
+
+
+def decode_shuffle(data):
+    return np.frombuffer(data, dtype=np.uint8).reshape(8, -1).T.copy().view("<f8").ravel()
+
+
+def encode_lines(values):
+    return "\n".join(values).encode()
+
+
+def decode_lines(data):
+    return data.decode().split("\n") if data else []
+
+
+ENCODINGS = {
+    "delta": (encode_delta, decode_delta),
+    "shuffle": (encode_shuffle, decode_shuffle),
+    "lines": (encode_lines, decode_lines),
+}
+
+
+def write_frame(f, data):
+    f.write(LENGTH.pack(len(data)))
+    f.write(data)
+
+
+def read_frame(f):
+    prefix = f.read(LENGTH.size)
+    if not prefix:
+        return None
+    if len(prefix) < LENGTH.size:
+        raise ValueError("Truncated columnar file")
+    length, = LENGTH.unpack(prefix)
+    data = f.read(length)
+    if len(data) < length:
+        raise ValueError("Truncated columnar file")
+    return data
+
+
+# Writes the readings of one room to an open binary file, one write_chunk()
+# per batch of rows.
+class ColumnWriter:
+    def __init__(self, f, room, level=6):
+        self.f = f
+        self.room = room
+        self.level = level
+        self.rows = 0
+        f.write(MAGIC)
+        write_frame(f, json.dumps({"version": VERSION, "room": room.name, "table": room.table,
+                                   "columns": room.columns}).encode())
+
+    # datetimes: list of str, ts: int64 array, fields: {column: float64 array}
+    def write_chunk(self, datetimes, ts, fields):
+        blocks = [("datetime", "lines", datetimes), ("ts", "delta", ts)]
+        blocks += [(column, "shuffle", fields[column]) for column in self.room.columns]
+        data = [zlib.compress(ENCODINGS[encoding][0](values), self.level) for name, encoding, values in blocks]
+        write_frame(self.f, json.dumps({"rows": len(ts), "blocks": [[name, encoding, len(block)] for
+                                        (name, encoding, values), block in zip(blocks, data)]}).encode())
+        for block in data:
+            self.f.write(block)
+        self.rows += len(ts)
+
+
+# Reads a file written by ColumnWriter. `header` is available right away and
+# iterating yields (datetimes, ts, {column: values}) per chunk.
+class ColumnReader:
+    def __init__(self, f):
+        self.f = f
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a columnar readings file")
+        self.header = json.loads(read_frame(f))
+        if self.header["version"] > VERSION:
+            raise ValueError(f"Unsupported columnar file version {self.header['version']}")
+
+    def __iter__(self):
+        while True:
+            frame = read_frame(self.f)
+            if frame is None:
+                return
+            chunk = json.loads(frame)
+            columns = {}
+            for name, encoding, size in chunk["blocks"]:
+                columns[name] = ENCODINGS[encoding][1](zlib.decompress(self.f.read(size)))
+            datetimes = columns.pop("datetime")
+            ts = columns.pop("ts")
+            if len(ts) != chunk["rows"] or len(datetimes) != chunk["rows"]:
+                raise ValueError("Corrupt chunk in columnar file")
+            yield datetimes, ts, columns
@@ -0,0 +1,79 @@
+import sqlite3
+from migrate_db import DB_PATH
+
+
+# Long-lived writer connection. WAL lets the Flask readers keep reading while a
+# batch is being committed, and synchronous=NORMAL only fsyncs at checkpoints.
+def connect(path=DB_PATH):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+# SQLITE_BUSY and SQLITE_LOCKED, the only errors that go away by themselves.
+BUSY_CODES = (5, 6)
+
+
+# Whether a batch failing with sql_e can succeed later ("database is locked").
+# Anything else, like a read-only file or a disk I/O error, will fail again.
+def is_busy(sql_e):
+    code = getattr(sql_e, "sqlite_errorcode", None)
+    if code is None:
+        # Python before 3.11 only has the message.
+        return "locked" in str(sql_e) or "busy" in str(sql_e)
+    return (code & 0xff) in BUSY_CODES
+
+
+# Outcomes of write_batch.
+COMMITTED = "committed"
+RETRY = "retry"
+DROPPED = "dropped"
+
+
+# Writes {query: [rows]} with executemany in one transaction, after the
+# schema statements the rows need (creating a new month's partition). Returns
+# (status, skipped): RETRY if the database was busy and the batch should be
+# retried later, DROPPED if it cannot be written at all. When a row
+# breaks a constraint the batch is written again row by row, and the rows that
+# still fail are skipped and returned as (query, row) pairs.
+def write_batch(conn, pending, schema=()):
+    try:
+        with conn:
+            for statement in schema:
+                conn.execute(statement)
+            for query, rows in pending.items():
+                conn.executemany(query, rows)
+    except sqlite3.IntegrityError as sql_e:
+        print(f"sqlite error occurred, writing batch row by row: {sql_e}")
+        return write_rows(conn, pending, schema)
+    except sqlite3.Error as sql_e:
+        if is_busy(sql_e):
+            print(f"sqlite error occurred, retrying batch later: {sql_e}")
+            return RETRY, []
+        print(f"sqlite error occurred, dropping batch: {sql_e}")
+        return DROPPED, []
+    return COMMITTED, []
+
+
+# A failing statement only undoes itself, so the good rows still commit together.
+def write_rows(conn, pending, schema):
+    skipped = []
+    try:
+        with conn:
+            for statement in schema:
+                conn.execute(statement)
+            for query, rows in pending.items():
+                for row in rows:
+                    try:
+                        conn.execute(query, row)
+                    except sqlite3.IntegrityError as sql_e:
+                        print(f"sqlite error occurred, skipping row {row}: {sql_e}")
+                        skipped.append((query, row))
+    except sqlite3.Error as sql_e:
+        if is_busy(sql_e):
+            print(f"sqlite error occurred, retrying batch later: {sql_e}")
+            return RETRY, []
+        print(f"sqlite error occurred, dropping batch: {sql_e}")
+        return DROPPED, []
+    return COMMITTED, skipped
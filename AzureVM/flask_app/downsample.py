@@ -0,0 +1,58 @@
+import numpy as np
+
+# Reduces a long series to roughly max_points points before plotting, so render
+# time depends on the chart width instead of on how much history is shown.
+#
+#   minmax  keeps the lowest and highest point of every bucket (vectorized),
+#           so short CO2/humidity spikes always survive
+#   lttb    Largest-Triangle-Three-Buckets, visually closest to the raw line
+
+METHODS = ("minmax", "lttb")
+
+
+def minmax_indices(y, max_points):
+    n = len(y)
+    buckets = max(max_points // 2, 1)
+    size = -(-n // buckets)
+    buckets = -(-n // size)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    grid = padded.reshape(buckets, size)
+    pair = np.sort(np.stack([np.nanargmin(grid, axis=1), np.nanargmax(grid, axis=1)], axis=1), axis=1)
+    return np.unique((pair + (np.arange(buckets) * size)[:, None]).ravel())
+
+
+def lttb_indices(x, y, max_points):
+    n = len(y)
+    x = x.astype(np.float64)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.intp)
+    indices = np.empty(max_points, dtype=np.intp)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        indices[i + 1] = a
+    return indices
+
+
+# Returns (time, values) of one column of a get_data.Series, downsampled.
+def downsample(series, column, max_points, method="minmax"):
+    values = series[column]
+    if max_points is None or len(values) <= max_points or max_points < 3:
+        return series.time, values
+    if method == "lttb":
+        indices = lttb_indices(series.ts, values, max_points)
+    elif method == "minmax":
+        indices = minmax_indices(values, max_points)
+    else:
+        raise ValueError(f"Unknown downsampling method {method!r}, expected one of {METHODS}")
+    return series.time[indices], values[indices]
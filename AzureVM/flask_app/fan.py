@@ -1,26 +1,21 @@
-from get_data import *
-import paho.mqtt.publish as publish
-from time import sleep
+import argparse
+from migrate_db import migrate
+from rules import RuleEngine
 
-def fan():
-    timestamps, temp, hum, tvoc, part, co2 = get_stue_data(1)
-    print('temp: ' + str(temp[0]))
-    print('hum: ' + str(hum[0]))
-    print('co2: ' + str(co2[0]))
-    
-    if hum[0] > 50:
-        publish.single("sensor/stue/fan", "1", hostname="localhost")
-   
-    elif co2[0] > 1100:
-        publish.single("sensor/stue/fan", "1", hostname="localhost")
+# Climate controller: runs the rules in rules.py (the living room fan on
+# humidity and CO2, and whatever else is declared there) against the sensor
+# readings as they arrive over MQTT.
 
-    elif co2[0] < 700:
-        publish.single("sensor/stue/fan", "0", hostname="localhost")
 
-    elif hum[0] < 30:
-        publish.single("sensor/stue/fan", "0", hostname="localhost")
+def main():
+    parser = argparse.ArgumentParser(description="Switch fans and other actuators on the climate rules in rules.py")
+    parser.add_argument("--hostname", default="localhost")
+    args = parser.parse_args()
 
-print('fan script running')
-while True:
-    fan()
-    sleep(10)
\ No newline at end of file
+    print('fan script running')
+    migrate()
+    RuleEngine(hostname=args.hostname).run()
+
+
+if __name__ == "__main__":
+    main()
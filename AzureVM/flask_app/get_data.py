@@ -1,96 +1,249 @@
+import itertools
 import sqlite3
+import time
+import json
+import numpy as np
+import partitions
+from migrate_db import DB_PATH
+from rooms import ROOMS, rooms_by_name
+from rollups import pick_rollup
 
-def get_stue_data(number_of_rows):
-    while True:
-        query = """SELECT * FROM stue ORDER BY datetime DESC;"""
-        datetimes = []
-        temperatures = []
-        humidities = []
-        tvoc = []
-        particles =  []
-        co2 = []
-        try:
-            conn = sqlite3.connect("database/data.db")
-            cur = conn.cursor()
-            cur.execute(query)
-            rows = cur.fetchmany(number_of_rows)
-            for row in reversed(rows):
-                datetimes.append(row[0])
-                temperatures.append(row[1])
-                humidities.append(row[2]) 
-                tvoc.append(row[3])
-                particles.append(row[4])
-                co2.append(row[5])
-            return datetimes, temperatures, humidities, tvoc, particles, co2         
-        except sqlite3.Error as sql_e:
-            print(f"sqlite error occurred: {sql_e}")
-            conn.rollback()
 
-        except Exception as e:
-            print(f"Another error occured: {e}")
-        finally:
-            conn.close()
+# Columnar result set: one contiguous NumPy array per column, oldest first,
+# plus the epoch-ms "ts" column as a UTC datetime64 time axis.
+class Series:
+    def __init__(self, ts, fields):
+        self.ts = ts
+        self.time = ts.astype("datetime64[ms]")
+        self.fields = fields
 
+    def __getitem__(self, column):
+        return self.fields[column]
 
-get_stue_data(1000)
+    def __len__(self):
+        return len(self.ts)
 
-def get_bath_data(number_of_rows):
-    while True:
-        query = """SELECT * FROM bad ORDER BY datetime DESC;"""
-        datetimes = []
-        temperatures = []
-        humidities = []
-        battery = []
-        try:
-            conn = sqlite3.connect("database/data.db")
-            cur = conn.cursor()
-            cur.execute(query)
-            rows = cur.fetchmany(number_of_rows)
-            for row in reversed(rows):
-                datetimes.append(row[0])
-                temperatures.append(row[1])
-                humidities.append(row[2]) 
-                battery.append(row[3])
-            return datetimes, temperatures, humidities, battery           
-        except sqlite3.Error as sql_e:
-            print(f"sqlite error occurred: {sql_e}")
-            conn.rollback()
+    def tail(self, number_of_rows):
+        return Series(self.ts[-number_of_rows:], {column: values[-number_of_rows:] for column, values in self.fields.items()})
 
-        except Exception as e:
-            print(f"Another error occured: {e}")
-        finally:
-            conn.close()
+    # Min/max envelope of rollup buckets as a plain Series: every bucket becomes
+    # its min at the bucket start and its max half a bucket later, so peaks
+    # survive even when a bucket spans hours. The max is never placed after
+    # the bucket's newest reading, which would put it in the future for the
+    # current bucket.
+    def envelope(self, columns, bucket_ms):
+        ts = np.repeat(self.ts, 2)
+        ts[1::2] = np.minimum(self.ts + bucket_ms // 2, self.fields["last_ts"])
+        fields = {}
+        for column in columns:
+            values = np.empty(len(ts))
+            values[0::2] = self.fields[f"{column}_min"]
+            values[1::2] = self.fields[f"{column}_max"]
+            fields[column] = values
+        return Series(ts, fields)
 
+    @classmethod
+    def from_cursor(cls, cur, room, newest_first=True):
+        # Filled straight from the cursor (or any iterable of rows) into one
+        # structured array; newest first rows are reversed, and each column
+        # gets its own contiguous copy.
+        records = np.fromiter(cur, dtype=np.dtype(room.record_fields))
+        if newest_first:
+            records = records[::-1]
+        fields = {column: np.ascontiguousarray(records[column]) for column in room.columns}
+        return cls(np.ascontiguousarray(records["ts"]), fields)
 
-get_bath_data(10)
 
-def get_bedroom_data(number_of_rows):
-    while True:
-        query = """SELECT * FROM bedroom ORDER BY datetime DESC;"""
-        datetimes = []
-        temperatures = []
-        humidities = []
-        battery = []
+READ_ATTEMPTS = 3
+
+
+# Runs read(conn) on a fresh connection and returns its result. Any
+# OperationalError is retried a few times with a short pause: "database is
+# locked", and "no such table" when retention drops a partition between listing
+# and querying it. Anything else, like a row that is not a reading, is raised.
+def read_db(read):
+    for attempt in range(READ_ATTEMPTS):
+        conn = sqlite3.connect(DB_PATH)
         try:
-            conn = sqlite3.connect("database/data.db")
-            cur = conn.cursor()
-            cur.execute(query)
-            rows = cur.fetchmany(number_of_rows)
-            for row in reversed(rows):
-                datetimes.append(row[0])
-                temperatures.append(row[1])
-                humidities.append(row[2]) 
-                battery.append(row[3])
-            return datetimes, temperatures, humidities, battery           
-        except sqlite3.Error as sql_e:
+            return read(conn)
+        except sqlite3.OperationalError as sql_e:
             print(f"sqlite error occurred: {sql_e}")
-            conn.rollback()
-
-        except Exception as e:
-            print(f"Another error occured: {e}")
+            if attempt == READ_ATTEMPTS - 1:
+                raise
         finally:
             conn.close()
+        time.sleep(0.1 * (attempt + 1))
+
+
+# Newest rows of a room, newest first, read from the newest partition back
+# until there are number_of_rows of them.
+def newest_rows(conn, room, number_of_rows, columnar, since_ts):
+    rows = []
+    for partition in reversed(partitions.overlapping(conn, room, since_ts)):
+        remaining = number_of_rows - len(rows)
+        if remaining <= 0:
+            break
+        if since_ts is None:
+            query, args = (partition.columns_query if columnar else partition.select_query), (remaining,)
+        else:
+            query, args = (partition.since_columns_query if columnar else partition.since_query), (since_ts, remaining)
+        rows += conn.execute(query, args).fetchall()
+    return rows
+
+
+# Returns the newest rows of a room oldest-first as one list per column:
+# (datetimes, <room columns in registry order>), or as a Series if columnar.
+# With since_ts only rows newer than that cursor (epoch ms) are returned, so a
+# client can catch up from the last ts it has seen.
+def get_room_data(room_name, number_of_rows, columnar=False, since_ts=None):
+    room = rooms_by_name[room_name]
+    rows = read_db(lambda conn: newest_rows(conn, room, number_of_rows, columnar, since_ts))
+    if columnar:
+        return Series.from_cursor(rows, room)
+    rows.reverse()
+    if not rows:
+        return tuple([] for column in range(len(room.columns) + 1))
+    return tuple(list(column) for column in zip(*rows))
+
+
+WINDOW_UNITS = {"m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+# "30m", "24h", "7d", "4w" -> seconds. Raises ValueError for anything else.
+def parse_window(text):
+    if text[-1:] not in WINDOW_UNITS:
+        raise ValueError(f"Invalid window {text!r}, use e.g. 30m, 24h, 7d or 4w")
+    return int(text[:-1]) * WINDOW_UNITS[text[-1]]
+
 
+# Every reading of a room with since_ts <= ts < until_ts (epoch ms) as a Series.
+def get_room_window(room_name, since_ts, until_ts=None):
+    room = rooms_by_name[room_name]
+    if until_ts is None:
+        until_ts = int(time.time() * 1000) + 1
 
+    def read(conn):
+        rows = itertools.chain.from_iterable(conn.execute(partition.window_query, (since_ts, until_ts))
+                                             for partition in partitions.overlapping(conn, room, since_ts, until_ts))
+        return Series.from_cursor(rows, room, newest_first=False)
+    return read_db(read)
 
-get_bedroom_data(10)
\ No newline at end of file
+
+# Rollup buckets of a room with since_ts <= bucket < until_ts as a Series with
+# count, last_ts and <column>_min/_max/_sum/_last/_avg fields, timed by
+# bucket start.
+def get_rollup_window(rollup, since_ts, until_ts):
+    def read(conn):
+        cur = conn.execute(rollup.select_query, (since_ts - since_ts % rollup.bucket_ms, until_ts))
+        return np.fromiter(cur, dtype=np.dtype(rollup.record_fields))
+    records = read_db(read)
+    fields = {name: np.ascontiguousarray(records[name]) for name in ["count", "last_ts"] + rollup.metrics}
+    for column in rollup.room.columns:
+        fields[f"{column}_avg"] = fields[f"{column}_sum"] / fields["count"]
+    return Series(np.ascontiguousarray(records["bucket"]), fields)
+
+
+# COALESCE of a scalar subquery over a room's two newest partitions, so a
+# new month that has no readings yet falls back to the one before.
+def newest_partitions_subquery(conn, room, subquery):
+    newest = partitions.partitions(conn, room)[-2:]
+    if not newest:
+        return "NULL"
+    return "COALESCE(" + ", ".join(subquery(partition) for partition in reversed(newest)) + ", NULL)"
+
+
+# Newest ts of each room in one statement; the ts index makes each MAX() a
+# single index lookup. Used to tell whether cached charts are still current.
+def get_latest_timestamps(room_names):
+    def read(conn):
+        query = "SELECT " + ", ".join(
+            newest_partitions_subquery(conn, rooms_by_name[name], lambda partition: f"(SELECT MAX(ts) FROM {partition.table})")
+            for name in room_names)
+        return conn.execute(query).fetchone()
+    return read_db(read)
+
+
+# Newest reading of every room in one statement, as {room: {column: value}}.
+# A room without any rows maps to None.
+def get_latest_readings():
+    def read(conn):
+        query = "SELECT " + ", ".join(
+            newest_partitions_subquery(conn, room, lambda partition: partition.latest_subquery) for room in ROOMS)
+        return conn.execute(query).fetchone()
+    row = read_db(read)
+    return {room.name: json.loads(text) if text is not None else None for room, text in zip(ROOMS, row)}
+
+
+# Per-request view of the data. Each room window is fetched once and shared by
+# every chart built in the same request; a smaller window of a room already
+# fetched is sliced from the larger one instead of queried again. With a hot
+# cache (hot_cache.HotCache) that is ready, latest values and short windows
+# are answered from memory and only history goes to SQLite.
+class DataContext:
+    def __init__(self, cache=None):
+        self.now = int(time.time() * 1000)
+        self.cache = cache if cache is not None and cache.ready() else None
+        self.windows = {}
+        self.spans = {}
+        self.latest = None
+        self.timestamps = None
+
+    def room(self, room_name, number_of_rows, columnar=False):
+        for rows, data in self.windows.get((room_name, columnar), {}).items():
+            if rows >= number_of_rows:
+                if columnar:
+                    return data.tail(number_of_rows)
+                return tuple(column[-number_of_rows:] for column in data)
+        data = None
+        if columnar and self.cache is not None:
+            data = self.cache.room(room_name, number_of_rows)
+        if data is None:
+            data = get_room_data(room_name, number_of_rows, columnar)
+        self.windows.setdefault((room_name, columnar), {})[number_of_rows] = data
+        return data
+
+    # Last `seconds` of a room as a Series, relative to when the request began.
+    # With max_points the coarsest rollup that still gives that many points is
+    # read instead of the raw rows, as a min/max envelope per bucket.
+    def window(self, room_name, seconds, max_points=None):
+        return self.span(room_name, self.now - seconds * 1000, self.now + 1, max_points)
+
+    def span(self, room_name, since_ts, until_ts, max_points=None):
+        rollup = pick_rollup(room_name, until_ts - since_ts, max_points) if max_points else None
+        key = (room_name, since_ts, until_ts, rollup and rollup.name)
+        if key not in self.spans:
+            if rollup is None:
+                data = None
+                if self.cache is not None:
+                    data = self.cache.span(room_name, since_ts, until_ts)
+                self.spans[key] = data if data is not None else get_room_window(room_name, since_ts, until_ts)
+            else:
+                buckets = get_rollup_window(rollup, since_ts, until_ts)
+                self.spans[key] = buckets.envelope(rollup.room.columns, rollup.bucket_ms)
+        return self.spans[key]
+
+    def latest_readings(self):
+        if self.latest is None:
+            self.latest = self.cache.latest_readings() if self.cache is not None else get_latest_readings()
+        return self.latest
+
+    def latest_timestamps(self, room_names):
+        if self.timestamps is None:
+            if self.cache is not None:
+                self.timestamps = self.cache.latest_timestamps()
+            else:
+                names = [room.name for room in ROOMS]
+                self.timestamps = dict(zip(names, get_latest_timestamps(names)))
+        return tuple(self.timestamps[name] for name in room_names)
+
+
+def get_stue_data(number_of_rows):
+    return get_room_data("stue", number_of_rows)
+
+
+def get_bath_data(number_of_rows):
+    return get_room_data("bath", number_of_rows)
+
+
+def get_bedroom_data(number_of_rows):
+    return get_room_data("bedroom", number_of_rows)
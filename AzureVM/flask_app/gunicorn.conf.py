@@ -0,0 +1,43 @@
+import multiprocessing
+import os
+import secrets
+
+# Production serving: gunicorn -c gunicorn.conf.py
+#
+# One process per core keeps requests from queueing behind each other; threads
+# per worker carry the I/O bound requests and the long lived /api/stream
+# connections. Chart renders go to each worker's render pool (render_pool.py),
+# sized so all pools together use every core once. At most half of a worker's
+# threads serve /api/stream at a time (api.max_streams); further streams get a
+# 503 and retry, so open dashboards cannot starve the other requests. A
+# closed stream holds its slot until its next keepalive (api.keepalive_seconds).
+# WEB_WORKERS, WEB_THREADS, RENDER_WORKERS and MAX_STREAMS override the counts,
+# WEB_BIND the address.
+#
+# Database connections are not pooled or warmed: SQLite has no server to
+# handshake with, opening one costs well under a millisecond, and its page
+# cache lives and dies with the connection. What does carry over is the OS
+# file cache, which the chart cache warm-up (app.warm_caches) fills by reading
+# the default views of every room.
+
+wsgi_app = "app:create_app()"
+bind = os.environ.get("WEB_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_WORKERS", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 16))
+# Streams stay open; only a worker that stops answering is restarted.
+timeout = 120
+graceful_timeout = 10
+
+
+def on_starting(server):
+    from migrate_db import migrate
+    migrate()
+    os.environ.setdefault("SECRET_KEY", secrets.token_hex(16))
+    os.environ.setdefault("RENDER_WORKERS", str(max(1, multiprocessing.cpu_count() // workers)))
+    os.environ.setdefault("MAX_STREAMS", str(max(1, threads // 2)))
+
+
+def worker_exit(server, worker):
+    from render_pool import render_pool
+    render_pool.shutdown()
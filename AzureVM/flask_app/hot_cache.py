@@ -0,0 +1,153 @@
+import threading
+import time
+import numpy as np
+from get_data import Series, get_room_data
+from live import live_hub
+from migrate_db import TIME_FORMAT
+from rooms import ROOMS
+
+# Process-level hot cache of the newest readings per room. Each room keeps its
+# last `capacity` readings in a fixed-size structured NumPy ring buffer, filled
+# once from SQLite and then kept current from the live hub's MQTT subscription.
+# Latest-value lookups are O(1) and short windows are sliced from memory; the
+# cache only answers while the subscription is up, otherwise callers go to SQLite.
+
+
+class RingBuffer:
+    def __init__(self, room, capacity):
+        self.room = room
+        self.capacity = capacity
+        self.records = np.zeros(capacity, dtype=np.dtype(room.record_fields))
+        self.head = 0
+        self.count = 0
+        # True while the buffer still holds every reading the room has.
+        self.complete = True
+        self.latest = None
+        self.lock = threading.Lock()
+
+    def append(self, reading):
+        with self.lock:
+            self.push(reading)
+
+    # Raises KeyError, TypeError or ValueError for a malformed reading, before
+    # the buffer is touched.
+    def push(self, reading):
+        ts = int(reading["ts"])
+        values = [float(reading[column]) for column in self.room.columns]
+        if self.latest is not None and ts <= self.latest["ts"]:
+            return
+        record = self.records[self.head]
+        record["ts"] = ts
+        for column, value in zip(self.room.columns, values):
+            record[column] = value
+        self.head = (self.head + 1) % self.capacity
+        if self.count == self.capacity:
+            self.complete = False
+        else:
+            self.count += 1
+        self.latest = {"datetime": time.strftime(TIME_FORMAT, time.localtime(ts / 1000)), "ts": ts}
+        self.latest.update(zip(self.room.columns, values))
+
+    # Replaces the contents with a Series read from SQLite, keeping any live
+    # readings that arrived while it was being read.
+    def load(self, series, complete):
+        with self.lock:
+            newer = self.ordered()
+            newer = newer[newer["ts"] > (series.ts[-1] if len(series) else -1)]
+            self.head = 0
+            self.count = 0
+            self.complete = complete
+            self.latest = None
+            for i in range(len(series)):
+                reading = {column: series[column][i] for column in self.room.columns}
+                reading["ts"] = int(series.ts[i])
+                self.push(reading)
+            for record in newer:
+                self.push({name: record[name].item() for name in record.dtype.names})
+
+    def ordered(self):
+        if self.count < self.capacity:
+            return self.records[:self.count].copy()
+        return np.concatenate((self.records[self.head:], self.records[:self.head]))
+
+    def series(self):
+        with self.lock:
+            records = self.ordered()
+        return Series(np.ascontiguousarray(records["ts"]),
+                      {column: np.ascontiguousarray(records[column]) for column in self.room.columns})
+
+    # Whether every reading with ts >= since_ts is in the buffer.
+    def covers(self, since_ts):
+        with self.lock:
+            if self.complete:
+                return True
+            return self.records[self.head]["ts"] <= since_ts
+
+
+class HotCache:
+    def __init__(self, capacity=2000):
+        self.capacity = capacity
+        self.buffers = {room.name: RingBuffer(room, capacity) for room in ROOMS}
+        self.generation = None
+        self.lock = threading.Lock()
+        self.started = False
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        live_hub.add_listener(self.on_readings)
+
+    def on_readings(self, readings):
+        for reading in readings:
+            buffer = self.buffers.get(reading["room"])
+            if buffer is None:
+                continue
+            try:
+                buffer.append(reading)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Bad live reading for {reading['room']}: {e}")
+
+    # The cache answers only while the live subscription is up and its thread
+    # is running. After every
+    # (re)subscription the buffers are refilled from SQLite once, since
+    # readings may have been missed while it was down.
+    def ready(self):
+        if not self.started or not live_hub.connected.is_set() or not live_hub.alive():
+            return False
+        generation = live_hub.generation
+        if self.generation == generation:
+            return True
+        with self.lock:
+            if self.generation != generation:
+                for name, buffer in self.buffers.items():
+                    series = get_room_data(name, self.capacity, columnar=True)
+                    buffer.load(series, len(series) < self.capacity)
+                self.generation = generation
+        return True
+
+    def latest_readings(self):
+        return {name: buffer.latest for name, buffer in self.buffers.items()}
+
+    def latest_timestamps(self):
+        return {name: buffer.latest and buffer.latest["ts"] for name, buffer in self.buffers.items()}
+
+    # Newest number_of_rows readings of a room, or None if not all are cached.
+    def room(self, room_name, number_of_rows):
+        buffer = self.buffers[room_name]
+        if number_of_rows > buffer.capacity or (buffer.count < number_of_rows and not buffer.complete):
+            return None
+        return buffer.series().tail(number_of_rows)
+
+    # Readings with since_ts <= ts < until_ts, or None if not all are cached.
+    def span(self, room_name, since_ts, until_ts):
+        buffer = self.buffers[room_name]
+        if not buffer.covers(since_ts):
+            return None
+        series = buffer.series()
+        start, end = np.searchsorted(series.ts, (since_ts, until_ts))
+        return Series(series.ts[start:end], {column: values[start:end] for column, values in series.fields.items()})
+
+
+hot_cache = HotCache()
@@ -0,0 +1,330 @@
+import asyncio
+import json
+import os
+import signal
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import paho.mqtt.client as mqtt
+import db_writer
+import partitions
+from migrate_db import DB_PATH, TIME_FORMAT
+from rooms import rooms_by_topic, LIVE_TOPIC
+from rollups import rollups_by_room
+
+POLICIES = ("block", "drop-oldest", "spill")
+SPILL_PATH = "database/ingest_spill.jsonl"
+
+
+# MQTT ingestion on an asyncio event loop. The paho socket is driven by the
+# loop itself (add_reader/add_writer), so receiving never waits on SQLite.
+# Messages go into a bounded asyncio.Queue that a single writer task drains in
+# batches; the actual SQLite calls run on one dedicated thread. Every committed
+# batch is announced on LIVE_TOPIC for the dashboards' live stream.
+#
+# When the queue is full the overflow policy decides what happens:
+#   block        stop reading the socket until the writer catches up
+#   drop-oldest  discard the oldest queued message
+#   spill        append the message to a JSONL file, replayed once there is room
+class IngestService:
+    def __init__(self, hostname="localhost", port=1883, path=DB_PATH, queue_size=1000, policy="block",
+                 batch_size=100, flush_interval_ms=1000, spill_path=SPILL_PATH, report_interval=60):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy {policy!r}, expected one of {POLICIES}")
+        self.hostname = hostname
+        self.port = port
+        self.path = path
+        self.queue_size = queue_size
+        self.policy = policy
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.spill_path = spill_path
+        self.report_interval = report_interval
+
+        self.counters = {"received": 0, "written": 0, "dropped": 0, "spilled": 0, "bad_payload": 0,
+                         "failed": 0}
+        self.lag_ms_last = 0
+        self.lag_ms_max = 0
+        self.blocked = deque()
+        self.reading_paused = False
+        self.spill_file = None
+        self.sock = None
+        self.misc_task = None
+        self.db = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats["queue_depth"] = self.queue.qsize() + len(self.blocked)
+        stats["lag_ms_last"] = self.lag_ms_last
+        stats["lag_ms_max"] = self.lag_ms_max
+        return stats
+
+    # paho <-> asyncio socket glue
+
+    def on_socket_open(self, client, userdata, sock):
+        self.sock = sock
+        if not self.reading_paused:
+            self.loop.add_reader(sock, client.loop_read)
+        self.misc_task = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        self.sock = None
+        if self.misc_task is not None:
+            self.misc_task.cancel()
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def misc_loop(self):
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+    def pause_reading(self):
+        self.reading_paused = True
+        if self.sock is not None:
+            self.loop.remove_reader(self.sock)
+
+    def resume_reading(self):
+        self.reading_paused = False
+        if self.sock is not None:
+            self.loop.add_reader(self.sock, self.client.loop_read)
+
+    # MQTT callbacks
+
+    def on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            print(f"MQTT connect failed: {reason_code}")
+            return
+        print(f"MQTT connected to {self.hostname}:{self.port}")
+        client.subscribe([(topic, 1) for topic in rooms_by_topic])
+
+    def on_disconnect(self, client, userdata, flags, reason_code, properties):
+        print(f"MQTT disconnected: {reason_code}")
+        self.disconnected.set()
+
+    def on_message(self, client, userdata, message):
+        self.counters["received"] += 1
+        self.offer((message.topic, int(time.time() * 1000), message.payload))
+
+    def offer(self, item):
+        if not self.queue.full():
+            self.queue.put_nowait(item)
+        elif self.policy == "drop-oldest":
+            self.queue.get_nowait()
+            self.counters["dropped"] += 1
+            self.queue.put_nowait(item)
+        elif self.policy == "spill":
+            self.spill(item)
+        else:
+            if not self.blocked:
+                self.pause_reading()
+            self.blocked.append(item)
+
+    def unblock(self):
+        while self.blocked and not self.queue.full():
+            self.queue.put_nowait(self.blocked.popleft())
+        if not self.blocked and self.reading_paused:
+            self.resume_reading()
+
+    # spill to disk
+
+    def spill(self, item):
+        topic, ts, payload = item
+        if self.spill_file is None:
+            self.spill_file = open(self.spill_path, "a", encoding="utf-8")
+        self.spill_file.write(json.dumps({"topic": topic, "ts": ts, "payload": payload.decode(errors="replace")}) + "\n")
+        self.counters["spilled"] += 1
+
+    async def replay_loop(self):
+        replay_path = self.spill_path + ".replay"
+        while not self.stopping.is_set():
+            if not os.path.exists(replay_path):
+                if self.queue.qsize() > self.queue_size // 2 or not os.path.exists(self.spill_path):
+                    await asyncio.sleep(1)
+                    continue
+                if self.spill_file is not None:
+                    self.spill_file.close()
+                    self.spill_file = None
+                os.replace(self.spill_path, replay_path)
+
+            with open(replay_path, encoding="utf-8") as spilled:
+                line = ""
+                try:
+                    for line in spilled:
+                        entry = json.loads(line)
+                        await self.queue.put((entry["topic"], entry["ts"], entry["payload"].encode()))
+                        line = ""
+                except asyncio.CancelledError:
+                    # Keep what has not been queued yet for the next start.
+                    rest = line + spilled.read()
+                    with open(replay_path + ".tmp", "w", encoding="utf-8") as remaining:
+                        remaining.write(rest)
+                    os.replace(replay_path + ".tmp", replay_path)
+                    raise
+            os.remove(replay_path)
+
+    # DB writer
+
+    # Returns the {query: rows} to write, the statements creating the
+    # partitions they go to and the readings to announce on LIVE_TOPIC once
+    # they are committed, each with the (query, row) storing it.
+    def rows(self, batch):
+        pending = {}
+        schema = {}
+        readings = []
+        for topic, ts, payload in batch:
+            room = rooms_by_topic.get(topic)
+            if room is None:
+                print(f"No room registered for topic: {topic}")
+                continue
+            try:
+                values = room.extract(json.loads(payload))
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Bad payload on {topic}: {e}")
+                self.counters["bad_payload"] += 1
+                continue
+            text = datetime.fromtimestamp(ts / 1000).strftime(TIME_FORMAT)
+            partition = partitions.partition_for(room, ts)
+            schema.update(dict.fromkeys(partitions.schema(partition)))
+            row = (text, ts) + values
+            pending.setdefault(partition.insert_query, []).append(row)
+            for rollup in rollups_by_room[room.name]:
+                pending.setdefault(rollup.upsert_query, []).append(rollup.row(ts, values))
+            reading = dict(zip(room.columns, values))
+            reading["room"] = room.name
+            reading["ts"] = ts
+            readings.append(((partition.insert_query, row), reading))
+        readings.sort(key=lambda entry: entry[1]["ts"])
+        return pending, list(schema), readings
+
+    async def next_batch(self):
+        try:
+            batch = [await asyncio.wait_for(self.queue.get(), self.flush_interval)]
+        except asyncio.TimeoutError:
+            return []
+        deadline = self.loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            if self.queue.empty():
+                self.unblock()
+            if self.queue.empty():
+                remaining = deadline - self.loop.time()
+                if remaining <= 0 or self.stopping.is_set():
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            else:
+                batch.append(self.queue.get_nowait())
+        self.unblock()
+        return batch
+
+    async def write_loop(self):
+        conn = await self.loop.run_in_executor(self.db, db_writer.connect, self.path)
+        try:
+            while not (self.stopping.is_set() and self.queue.empty() and not self.blocked):
+                batch = await self.next_batch()
+                if not batch:
+                    continue
+                pending, schema, readings = self.rows(batch)
+                while True:
+                    status, skipped = await self.loop.run_in_executor(self.db, db_writer.write_batch,
+                                                                      conn, pending, schema)
+                    if status != db_writer.RETRY:
+                        break
+                    if self.stopping.is_set():
+                        print(f"Giving up on {len(batch)} rows during shutdown")
+                        break
+                    await asyncio.sleep(1)
+                if status == db_writer.COMMITTED:
+                    now = int(time.time() * 1000)
+                    skipped = set(skipped)
+                    written = [reading for stored_by, reading in readings if stored_by not in skipped]
+                    self.counters["written"] += len(written)
+                    self.counters["failed"] += len(readings) - len(written)
+                    if written:
+                        self.client.publish(LIVE_TOPIC, json.dumps(written, separators=(",", ":")))
+                    self.lag_ms_last = now - batch[-1][1]
+                    self.lag_ms_max = max(self.lag_ms_max, now - batch[0][1])
+                else:
+                    self.counters["failed"] += len(readings)
+        finally:
+            await self.loop.run_in_executor(self.db, conn.close)
+
+    # A writer that died would leave readings piling up in the queue; stop the
+    # service instead, so it exits and systemd restarts it.
+    def writer_done(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"DB writer failed, stopping ingest: {task.exception()!r}")
+        self.stopping.set()
+
+    async def report_loop(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            print("ingest stats: " + " ".join(f"{key}={value}" for key, value in self.stats().items()))
+            self.lag_ms_max = 0
+
+    async def connect_loop(self):
+        delay = 1
+        while not self.stopping.is_set():
+            if self.disconnected.is_set():
+                self.disconnected.clear()
+                try:
+                    if self.client.host:
+                        self.client.reconnect()
+                    else:
+                        self.client.connect(self.hostname, self.port)
+                    delay = 1
+                except OSError as e:
+                    print(f"MQTT connection to {self.hostname}:{self.port} failed: {e}, retrying in {delay} s")
+                    self.disconnected.set()
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 60)
+                    continue
+            disconnected = asyncio.create_task(self.disconnected.wait())
+            stopping = asyncio.create_task(self.stopping.wait())
+            await asyncio.wait([disconnected, stopping], return_when=asyncio.FIRST_COMPLETED)
+            disconnected.cancel()
+            stopping.cancel()
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(self.queue_size)
+        self.stopping = asyncio.Event()
+        self.disconnected = asyncio.Event()
+        self.disconnected.set()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(signum, self.stopping.set)
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_message = self.on_message
+
+        writer = asyncio.create_task(self.write_loop())
+        writer.add_done_callback(self.writer_done)
+        background = [asyncio.create_task(self.report_loop())]
+        if self.policy == "spill":
+            background.append(asyncio.create_task(self.replay_loop()))
+        try:
+            await self.connect_loop()
+        finally:
+            print("Stopping ingest, flushing queued messages")
+            self.stopping.set()
+            self.client.disconnect()
+            for task in background:
+                task.cancel()
+            await writer
+            if self.spill_file is not None:
+                self.spill_file.close()
+            self.db.shutdown()
+            print("ingest stats: " + " ".join(f"{key}={value}" for key, value in self.stats().items()))
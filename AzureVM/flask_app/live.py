@@ -0,0 +1,127 @@
+import json
+import queue
+import threading
+import paho.mqtt.client as mqtt
+from rooms import LIVE_TOPIC
+from rules import ACTUATORS
+
+# Fan-out of committed readings to the dashboards' live streams. One MQTT
+# subscription on LIVE_TOPIC per web process feeds a bounded queue per
+# connected client, so server work scales with new readings, not with viewers.
+# In-process listeners (the hot cache) get every batch as well. `generation`
+# counts completed subscriptions; readings may have been missed whenever it
+# changes or `connected` is clear. The state actuators confirm on their state
+# topics is kept in actuator_states and streamed as {"actuator", "state"}.
+
+
+class LiveHub:
+    def __init__(self, hostname="localhost", port=1883, max_queue=1000):
+        self.hostname = hostname
+        self.port = port
+        self.max_queue = max_queue
+        self.subscribers = set()
+        self.listeners = []
+        self.actuators_by_state_topic = {actuator.state_topic: actuator for actuator in ACTUATORS}
+        self.actuator_states = {}
+        self.connected = threading.Event()
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.client = None
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.client is not None:
+                return
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+            self.client.on_connect = self.on_connect
+            self.client.on_subscribe = self.on_subscribe
+            self.client.on_disconnect = self.on_disconnect
+            self.client.on_message = self.on_message
+            self.client.reconnect_delay_set(min_delay=1, max_delay=60)
+            self.client.connect_async(self.hostname, self.port)
+            # Our own network thread instead of loop_start(), so alive() can
+            # tell when it has died.
+            self.thread = threading.Thread(target=self.client.loop_forever, kwargs={"retry_first_connection": True},
+                                           name="live-hub", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        with self.lock:
+            if self.client is None:
+                return
+            self.client.disconnect()
+            self.thread.join()
+            self.client = None
+            self.thread = None
+            self.connected.clear()
+
+    def alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            print(f"Live stream MQTT connect failed: {reason_code}")
+            return
+        client.subscribe([(LIVE_TOPIC, 0)] + [(topic, 1) for topic in self.actuators_by_state_topic])
+
+    def on_subscribe(self, client, userdata, mid, reason_codes, properties):
+        self.generation += 1
+        self.connected.set()
+
+    def on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self.connected.clear()
+
+    def on_message(self, client, userdata, message):
+        actuator = self.actuators_by_state_topic.get(message.topic)
+        if actuator is not None:
+            state = actuator.parse(message.payload)
+            if state is not None:
+                self.actuator_states[actuator.name] = state
+                self.broadcast([{"actuator": actuator.name, "state": state}])
+            return
+        try:
+            readings = json.loads(message.payload)
+            if not isinstance(readings, list):
+                raise ValueError(f"expected a list of readings, got {type(readings).__name__}")
+        except ValueError as e:
+            print(f"Bad payload on {message.topic}: {e}")
+            return
+        # A failing listener must not take the network thread down with it.
+        for listener in self.listeners:
+            try:
+                listener(readings)
+            except Exception as e:
+                print(f"Live listener {listener.__qualname__} failed: {e}")
+        self.broadcast(readings)
+
+    def broadcast(self, readings):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            if subscriber.qsize() + len(readings) > self.max_queue:
+                # A client this far behind is dropped; it reconnects and
+                # catches up from its last event id.
+                self.unsubscribe(subscriber)
+                subscriber.put_nowait(None)
+                continue
+            for reading in readings:
+                subscriber.put_nowait(reading)
+
+    def subscribe(self):
+        self.start()
+        subscriber = queue.Queue()
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+        self.start()
+
+
+live_hub = LiveHub()
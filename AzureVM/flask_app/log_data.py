@@ -1,91 +1,26 @@
-import sqlite3
-from datetime import datetime
-import json
-import paho.mqtt.subscribe as subscribe
+import argparse
+import asyncio
+from migrate_db import migrate
+from ingest import IngestService, POLICIES
 
-print("subscribe mqtt script running")
 
+def main():
+    parser = argparse.ArgumentParser(description="Log sensor readings from MQTT into database/data.db")
+    parser.add_argument("--hostname", default="localhost")
+    parser.add_argument("--queue-size", type=int, default=1000)
+    parser.add_argument("--policy", choices=POLICIES, default="block",
+                        help="what to do with new messages when the queue is full")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--flush-interval-ms", type=int, default=1000)
+    args = parser.parse_args()
 
-def bath_message(client, userdata, message):
-    query = """INSERT INTO bad (datetime, temperature, humidity, battery) VALUES(?, ?, ?, ?)"""
-    now = datetime.now()
-    now = now.strftime("%d/%m/%y %H:%M:%S")
-    dht11_data = json.loads(message.payload.decode())
-    data = (now, dht11_data['temp'], dht11_data['hum'], dht11_data['bat'])
+    print("subscribe mqtt script running")
+    migrate()
 
-    try:
-        conn = sqlite3.connect("database/data.db")
-        cur = conn.cursor()
-        cur.execute(query, data)
-        conn.commit()
-                    
-    except sqlite3.Error as sql_e:
-        print(f"sqlite error occurred: {sql_e}")
-        conn.rollback()
+    service = IngestService(hostname=args.hostname, queue_size=args.queue_size, policy=args.policy,
+                            batch_size=args.batch_size, flush_interval_ms=args.flush_interval_ms)
+    asyncio.run(service.run())
 
-    except Exception as e:
-        print(f"Another error occured: {e}")
-    finally:
-        conn.close
 
-
-def bedroom_message(client, userdata, message):
-    query = """INSERT INTO bedroom (datetime, temperature, humidity, battery) VALUES(?, ?, ?, ?)"""
-    now = datetime.now()
-    now = now.strftime("%d/%m/%y %H:%M:%S")
-    dht11_data = json.loads(message.payload.decode())
-    data = (now, dht11_data['temp'], dht11_data['hum'], dht11_data['bat'])
-    
-    try:
-        conn = sqlite3.connect("database/data.db")
-        cur = conn.cursor()
-        cur.execute(query, data)
-        conn.commit()
-                    
-    except sqlite3.Error as sql_e:
-        print(f"sqlite error occurred: {sql_e}")
-        conn.rollback()
-
-    except Exception as e:
-        print(f"Another error occured: {e}")
-    finally:
-        conn.close()
-
-def stue_message(client, userdata, message):
-    query = """INSERT INTO stue (datetime, temperature, humidity, tvoc, particles, co2 ) VALUES(?, ?, ?, ?, ?, ?)"""
-    now = datetime.now()
-    now = now.strftime("%d/%m/%y %H:%M:%S")
-    stue_data = json.loads(message.payload.decode())
-    data = (now, stue_data['temp'], stue_data['rh'], stue_data['tvoc'], stue_data['pm'], stue_data['co2'])   
-
-    try:
-        conn = sqlite3.connect("database/data.db")
-        cur = conn.cursor()
-        cur.execute(query, data)
-        conn.commit()
-                    
-    except sqlite3.Error as sql_e:
-        print(f"sqlite error occurred: {sql_e}")
-        conn.rollback()
-
-    except Exception as e:
-        print(f"Another error occured: {e}")
-    finally:
-        conn.close()
-
-topic_function_map = {
-    "sensor/bad/json": bath_message,
-    "sensor/bedroom/json": bedroom_message,
-    "sensor/stue/json": stue_message
-}
-
-
-def on_message_received(client, userdata, message):
-    topic = message.topic
-    if topic in topic_function_map:
-        topic_function_map[topic](client, userdata, message)
-    else:
-        print(f"No function mapped for topic: {topic}")
-
-topics = ["sensor/bedroom/json", "sensor/bad/json", "sensor/stue/json"]
-subscribe.callback(on_message_received, topics, hostname="localhost", userdata={"message_count": 0})
\ No newline at end of file
+if __name__ == "__main__":
+    main()
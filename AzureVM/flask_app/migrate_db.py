@@ -0,0 +1,112 @@
+import sqlite3
+from datetime import datetime
+from rooms import ROOMS
+import partitions
+import rollups
+
+DB_PATH = "database/data.db"
+TIME_FORMAT = "%d/%m/%y %H:%M:%S"
+# Seconds a service starting during another one's migration waits for it.
+MIGRATE_TIMEOUT = 3600
+
+
+def to_epoch_ms(text):
+    return int(datetime.strptime(text, TIME_FORMAT).timestamp() * 1000)
+
+
+# Version 1: integer epoch-millisecond "ts" column with a descending index,
+# backfilled from the old "%d/%m/%y %H:%M:%S" text column.
+def add_epoch_timestamps(conn):
+    conn.create_function("to_epoch_ms", 1, to_epoch_ms, deterministic=True)
+    for room in ROOMS:
+        table = room.table
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        if not columns:
+            continue
+        if "ts" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN ts INTEGER")
+        conn.execute(f"UPDATE {table} SET ts = to_epoch_ms(datetime) WHERE ts IS NULL")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_ts ON {table} (ts DESC)")
+
+
+# Version 2: 1-minute/1-hour/1-day rollup tables, built from existing rows.
+def add_rollups(conn):
+    rollups.create_rollup_tables(conn)
+    rollups.backfill(conn)
+
+
+# Version 3: audit log of the rule engine's actuations (rules.py).
+def add_actuations(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS actuations (datetime TEXT NOT NULL, ts INTEGER NOT NULL, "
+                 "actuator TEXT NOT NULL, state INTEGER NOT NULL, rule TEXT NOT NULL, reason TEXT)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_actuations_ts ON actuations (ts DESC)")
+
+
+# Version 4: every room table is split into monthly partitions
+# (partitions.py) and dropped. Runs inside migrate()'s transaction, so an
+# interrupted run leaves the old table as it was.
+def partition_room_tables(conn):
+    for room in ROOMS:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (room.table,)).fetchone():
+            continue
+        months = conn.execute(f"SELECT DISTINCT CAST(strftime('%Y%m', ts / 1000, 'unixepoch') AS INTEGER) "
+                              f"FROM {room.table} WHERE ts IS NOT NULL").fetchall()
+        columns = ", ".join(["datetime", "ts"] + room.columns)
+        for month, in months:
+            partition = partitions.get_partition(room, month)
+            conn.execute(partition.create_query)
+            conn.execute(f"INSERT INTO {partition.table} ({columns}) SELECT {columns} FROM {room.table} "
+                         "WHERE ts >= ? AND ts < ? ORDER BY ts", (partition.start_ts, partition.end_ts))
+            conn.execute(partition.index_query)
+        print(f"split {room.table} into {len(months)} monthly partitions")
+        conn.execute(f"DROP TABLE {room.table}")
+    # Rollups built by version 2 in the same run found no partitions yet.
+    rollups.backfill(conn)
+
+
+# Rooms added to the registry after a migration ran need nothing of their
+# own: their partitions are created with their first readings. Rollup tables
+# are created here with the current layout.
+def create_room_tables(conn):
+    rollups.create_rollup_tables(conn)
+
+
+migrations = [
+    add_epoch_timestamps,
+    add_rollups,
+    add_actuations,
+    partition_room_tables,
+]
+
+
+# The ingester, the fan controller and gunicorn all migrate at startup, often
+# at the same moment. The whole run is one transaction that takes the write
+# lock before reading user_version, so the first one migrates and the others
+# wait for it (up to MIGRATE_TIMEOUT) and then find the schema current.
+def migrate(path=DB_PATH):
+    conn = sqlite3.connect(path, timeout=MIGRATE_TIMEOUT, isolation_level=None)
+    try:
+        # A new database returns its free pages with incremental vacuum
+        # (retention.py), which has to be set before any table exists.
+        if conn.execute("SELECT count(*) FROM sqlite_master").fetchone()[0] == 0:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for number, step in enumerate(migrations[version:], start=version + 1):
+                print(f"migrating {path} to schema version {number} ({step.__name__})")
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {number}")
+            create_room_tables(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    except sqlite3.Error as sql_e:
+        print(f"sqlite error occurred: {sql_e}")
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,115 @@
+import bisect
+import calendar
+import time
+from rooms import RoomTable
+
+# Monthly partitions of the room data. The readings of a room live in one
+# table per UTC calendar month, named after the room's table and the month:
+# stue_p202610 holds every stue reading of October 2026. Partitions are
+# created by whoever writes the first reading of a month and are found by
+# name in sqlite_master, so every process sees the same set without caching.
+#
+# Readers ask for the partitions overlapping a time window and only touch
+# those, so a query over the last day costs the same however many years of
+# history there are, and retention drops whole months with one DROP TABLE.
+#
+# Month boundaries are whole UTC days, so every rollup bucket (1m, 1h, 1d)
+# falls inside a single partition.
+
+
+class Partition(RoomTable):
+    def __init__(self, room, month):
+        super().__init__(f"{room.table}_p{month}", room.columns)
+        self.room = room
+        self.month = month
+        self.start_ts = month_start(month)
+        self.end_ts = month_start(next_month(month))
+
+
+# Partition objects are only their queries, so they are kept per process.
+known = {}
+
+
+# 202610 for a ts (epoch ms) in October 2026, UTC.
+def month_of(ts):
+    t = time.gmtime(ts // 1000)
+    return t.tm_year * 100 + t.tm_mon
+
+
+def next_month(month):
+    year, month = divmod(month, 100)
+    return (year + 1) * 100 + 1 if month == 12 else year * 100 + month + 1
+
+
+def month_start(month):
+    year, month = divmod(month, 100)
+    return calendar.timegm((year, month, 1, 0, 0, 0)) * 1000
+
+
+def get_partition(room, month):
+    key = (room.name, month)
+    if key not in known:
+        known[key] = Partition(room, month)
+    return known[key]
+
+
+def partition_for(room, ts):
+    return get_partition(room, month_of(ts))
+
+
+# Every partition of a room, oldest first.
+def partitions(conn, room):
+    pattern = f"{room.table}_p{'[0-9]' * 6}"
+    names = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?", (pattern,))
+    return sorted((get_partition(room, int(name[-6:])) for name, in names), key=lambda partition: partition.month)
+
+
+# The partitions holding readings with since_ts <= ts < until_ts, oldest first.
+def overlapping(conn, room, since_ts=None, until_ts=None):
+    return [partition for partition in partitions(conn, room)
+            if (since_ts is None or partition.end_ts > since_ts)
+            and (until_ts is None or partition.start_ts < until_ts)]
+
+
+# Oldest and newest ts of a room, or None without readings.
+def oldest_ts(conn, room):
+    for partition in partitions(conn, room):
+        ts = conn.execute(f"SELECT min(ts) FROM {partition.table}").fetchone()[0]
+        if ts is not None:
+            return ts
+    return None
+
+
+def newest_ts(conn, room):
+    for partition in reversed(partitions(conn, room)):
+        ts = conn.execute(f"SELECT max(ts) FROM {partition.table}").fetchone()[0]
+        if ts is not None:
+            return ts
+    return None
+
+
+# Statements creating the partition, if needed.
+def schema(partition):
+    return [partition.create_query, partition.index_query]
+
+
+def create(conn, partition):
+    for statement in schema(partition):
+        conn.execute(statement)
+
+
+def drop(conn, partition):
+    conn.execute(f"DROP TABLE IF EXISTS {partition.table}")
+
+
+# Splits ts-sorted readings of a room into [(partition, start, end)] runs of
+# indexes that fall into the same month.
+def split(room, ts):
+    runs = []
+    start = 0
+    while start < len(ts):
+        partition = partition_for(room, int(ts[start]))
+        end = bisect.bisect_left(ts, partition.end_ts, lo=start)
+        runs.append((partition, start, end))
+        start = end
+    return runs
@@ -0,0 +1,74 @@
+import threading
+import paho.mqtt.client as mqtt
+
+# Long-lived MQTT publisher shared by every request thread of a web worker.
+# paho's client is thread-safe for publishing and reconnects by itself, so a
+# command costs one PUBLISH on an open connection instead of a TCP connect,
+# CONNECT/CONNACK and disconnect per request.
+#
+# publish() returns at once with paho's MQTTMessageInfo, whose
+# wait_for_publish()/is_published() report the broker's PUBACK; send() waits
+# for it. Commands are refused rather than queued while the broker is
+# unreachable, so a fan never gets switched by a stale click minutes later.
+
+
+class MqttPublisher:
+    def __init__(self, hostname="localhost", port=1883, timeout=2):
+        self.hostname = hostname
+        self.port = port
+        self.timeout = timeout
+        self.connected = threading.Event()
+        self.lock = threading.Lock()
+        self.client = None
+
+    def start(self):
+        with self.lock:
+            if self.client is not None:
+                return
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+            self.client.on_connect = self.on_connect
+            self.client.on_disconnect = self.on_disconnect
+            self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+            self.client.connect_async(self.hostname, self.port)
+            self.client.loop_start()
+
+    def stop(self):
+        with self.lock:
+            if self.client is None:
+                return
+            self.client.disconnect()
+            self.client.loop_stop()
+            self.client = None
+            self.connected.clear()
+
+    def on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            print(f"MQTT publisher connect failed: {reason_code}")
+            return
+        self.connected.set()
+
+    def on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self.connected.clear()
+
+    # Queues the message and returns its MQTTMessageInfo without waiting for
+    # the broker. Raises ConnectionError if the broker is not reachable.
+    def publish(self, topic, payload, qos=1, retain=False):
+        self.start()
+        if not self.connected.wait(self.timeout):
+            raise ConnectionError(f"MQTT broker {self.hostname}:{self.port} not connected")
+        info = self.client.publish(topic, payload, qos=qos, retain=retain)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            raise ConnectionError(f"MQTT publish to {topic} failed: {mqtt.error_string(info.rc)}")
+        return info
+
+    # Publishes and waits for the broker's acknowledgement. Raises
+    # TimeoutError if it does not arrive within timeout seconds.
+    def send(self, topic, payload, qos=1, retain=False, timeout=None):
+        info = self.publish(topic, payload, qos, retain)
+        info.wait_for_publish(timeout or self.timeout)
+        if not info.is_published():
+            raise TimeoutError(f"No acknowledgement for {topic} within {timeout or self.timeout} s")
+        return info
+
+
+publisher = MqttPublisher()
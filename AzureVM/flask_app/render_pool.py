@@ -0,0 +1,57 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Process pool the chart renderers (charts.py) run in, so matplotlib work of
+# concurrent requests runs on all cores instead of queueing on the GIL. Worker
+# processes are spawned rather than forked from the threaded web process and
+# import matplotlib once at startup. RENDER_WORKERS sets the pool size.
+
+
+def preload():
+    import chart_templates
+
+
+class RenderPool:
+    def __init__(self, workers=None):
+        self.workers = workers or int(os.environ.get("RENDER_WORKERS", 0)) or os.cpu_count()
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                                    initializer=preload)
+            return self.executor
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(cancel_futures=True)
+                self.executor = None
+
+    # Runs render(*args) in a worker and returns its result. If a worker died
+    # the pool is replaced and this one chart is rendered in-process.
+    def render(self, render, *args):
+        executor = self.start()
+        try:
+            return executor.submit(render, *args).result()
+        except BrokenProcessPool as e:
+            self.replace(executor, e)
+            return render(*args)
+
+    # Drops a broken executor so the next render starts a new one. Renders that
+    # failed on the same pool all call this; only the first one shuts it down.
+    def replace(self, broken, error):
+        with self.lock:
+            if self.executor is not broken:
+                return
+            print(f"Render pool broken, restarting it: {error}")
+            self.executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+
+render_pool = RenderPool()
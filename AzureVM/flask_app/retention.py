@@ -0,0 +1,221 @@
+import argparse
+import os
+import sqlite3
+import time
+import db_writer
+import partitions
+import rollups
+from get_data import parse_window
+from migrate_db import DB_PATH, migrate
+from rollups import RESOLUTIONS, rollups_by_room
+from rooms import rooms_by_name
+
+# Retention of the sensor tables. Per room, raw readings are kept for `raw`
+# (e.g. "30d") and each rollup resolution for as long as given in `rollups`
+# ({"1m": "365d"}); anything not listed is kept forever. Charts over long
+# windows are drawn from the rollups, so old raw rows are only dead weight in
+# every ORDER BY ts scan and in the backups.
+#
+# Cutoffs are rounded down to whole days (the coarsest rollup bucket), so no
+# rollup bucket is ever left with part of its raw rows. Before raw rows go,
+# the rollups of their days are rebuilt from them once more, in case they were
+# loaded without going through the ingester. The newest reading of a room is
+# never deleted, so the latest values stay on the charts of a dead sensor.
+#
+# Monthly partitions that lie wholly before the raw cutoff are dropped with one
+# DROP TABLE each. The rest, in the partition the cutoff falls in and in the
+# rollup tables, are deleted in batches of --batch-size, each its own short
+# write transaction, so log_data.py is never locked out for long. The freed pages
+# are then handed back to the file system with incremental vacuum; databases
+# created before that was enabled need one full `--vacuum` first.
+#
+#   python retention.py                 apply the rules
+#   python retention.py --dry-run       only count what would be deleted
+
+DAY_MS = max(bucket_ms for name, bucket_ms in RESOLUTIONS)
+
+
+class Retention:
+    def __init__(self, room_name, raw=None, rollups=None):
+        if room_name not in rooms_by_name:
+            raise ValueError(f"Unknown room {room_name!r}")
+        resolutions = [name for name, bucket_ms in RESOLUTIONS]
+        for name in rollups or {}:
+            if name not in resolutions:
+                raise ValueError(f"Unknown rollup {name!r}, expected one of {resolutions}")
+        self.room = rooms_by_name[room_name]
+        self.raw_ms = parse_window(raw) * 1000 if raw else None
+        self.rollups_ms = {name: parse_window(keep) * 1000 for name, keep in (rollups or {}).items()}
+        for name, keep_ms in self.rollups_ms.items():
+            if self.raw_ms is None or keep_ms < self.raw_ms:
+                raise ValueError(f"{room_name}: rollup {name} must be kept longer than the raw rows")
+
+    # Cutoff of the raw readings, or None when they are kept forever.
+    def raw_cutoff(self, now_ms):
+        return None if self.raw_ms is None else cutoff(now_ms, self.raw_ms)
+
+    # [(rollup table, cutoff)] of the rollup buckets older than cutoff to delete.
+    def expired(self, now_ms):
+        return [(rollup.table, cutoff(now_ms, self.rollups_ms[rollup.name]))
+                for rollup in rollups_by_room[self.room.name] if rollup.name in self.rollups_ms]
+
+
+RETENTION = [
+    Retention("stue", raw="30d"),
+    Retention("bath", raw="30d"),
+    Retention("bedroom", raw="30d"),
+]
+
+
+def cutoff(now_ms, keep_ms):
+    return (now_ms - keep_ms) - (now_ms - keep_ms) % DAY_MS
+
+
+def file_size(path):
+    return sum(os.path.getsize(path + suffix) for suffix in ("", "-wal") if os.path.exists(path + suffix))
+
+
+# Rebuilds the rollups of every whole day from the oldest raw row up to cutoff.
+def settle_rollups(conn, room, until_ts):
+    oldest_ts = partitions.oldest_ts(conn, room)
+    if oldest_ts is None:
+        return
+    for day in range(oldest_ts - oldest_ts % DAY_MS, until_ts, DAY_MS):
+        with conn:
+            rollups.rebuild_range(conn, room.name, day, day + DAY_MS - 1)
+
+
+def delete_batched(conn, table, column, cutoff_ts, batch_size, pause):
+    query = (f"DELETE FROM {table} WHERE rowid IN "
+             f"(SELECT rowid FROM {table} WHERE {column} < ? LIMIT ?)")
+    deleted = 0
+    while True:
+        with conn:
+            count = conn.execute(query, (cutoff_ts, batch_size)).rowcount
+        deleted += count
+        if count < batch_size:
+            return deleted
+        time.sleep(pause)
+
+
+# The cutoff moved back to the room's newest reading if that is older, so a
+# sensor that has gone quiet keeps its last reading for the bar charts. None
+# without readings.
+def keep_newest(conn, room, cutoff_ts):
+    newest = partitions.newest_ts(conn, room)
+    return None if newest is None else min(cutoff_ts, newest)
+
+
+# Drops the partitions of a room wholly before cutoff and deletes the older
+# rows of the one it falls in. The newest reading is always kept. Returns the
+# number of rows removed.
+def expire_raw(conn, room, cutoff_ts, batch_size, pause):
+    cutoff_ts = keep_newest(conn, room, cutoff_ts)
+    if cutoff_ts is None:
+        return 0
+    deleted = 0
+    for partition in partitions.overlapping(conn, room, until_ts=cutoff_ts):
+        if partition.end_ts <= cutoff_ts:
+            with conn:
+                deleted += conn.execute(f"SELECT count(*) FROM {partition.table}").fetchone()[0]
+                partitions.drop(conn, partition)
+            time.sleep(pause)
+        else:
+            deleted += delete_batched(conn, partition.table, "ts", cutoff_ts, batch_size, pause)
+    return deleted
+
+
+def count_expired(conn, room, cutoff_ts):
+    cutoff_ts = keep_newest(conn, room, cutoff_ts)
+    if cutoff_ts is None:
+        return 0
+    return sum(conn.execute(f"SELECT count(*) FROM {partition.table} WHERE ts < ?", (cutoff_ts,)).fetchone()[0]
+               for partition in partitions.overlapping(conn, room, until_ts=cutoff_ts))
+
+
+def day(ts):
+    return time.strftime('%Y-%m-%d', time.gmtime(ts / 1000))
+
+
+# Returns free pages to the file system, a step at a time. Returns the number
+# of pages released.
+def incremental_vacuum(conn, step_pages, pause):
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    start = free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    while free:
+        # Every step of the statement releases one page; executescript() runs
+        # it to completion, where execute() would stop after the first.
+        conn.executescript(f"PRAGMA incremental_vacuum({step_pages})")
+        remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if remaining >= free:
+            break
+        free = remaining
+        time.sleep(pause)
+    return start - free
+
+
+def apply(path, rules, batch_size, pause, vacuum, dry_run):
+    now_ms = int(time.time() * 1000)
+    size_before = file_size(path)
+    conn = db_writer.connect(path)
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        for rule in rules:
+            cutoff_ts = rule.raw_cutoff(now_ms)
+            if cutoff_ts is not None:
+                if dry_run:
+                    print(f"{rule.room.name}: {count_expired(conn, rule.room, cutoff_ts)} rows before {day(cutoff_ts)}")
+                else:
+                    start = time.perf_counter()
+                    settle_rollups(conn, rule.room, cutoff_ts)
+                    deleted = expire_raw(conn, rule.room, cutoff_ts, batch_size, pause)
+                    print(f"{rule.room.name}: deleted {deleted} rows in {time.perf_counter() - start:.1f} s")
+            for table, cutoff_ts in rule.expired(now_ms):
+                if dry_run:
+                    count = conn.execute(f"SELECT count(*) FROM {table} WHERE bucket < ?", (cutoff_ts,)).fetchone()[0]
+                    print(f"{table}: {count} rows before {day(cutoff_ts)}")
+                    continue
+                start = time.perf_counter()
+                deleted = delete_batched(conn, table, "bucket", cutoff_ts, batch_size, pause)
+                print(f"{table}: deleted {deleted} rows in {time.perf_counter() - start:.1f} s")
+        if dry_run:
+            return
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if vacuum:
+            print("running a full VACUUM with incremental vacuum enabled")
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            released = free_pages
+        else:
+            released = incremental_vacuum(conn, 1024, pause)
+            if free_pages and conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                print(f"{free_pages} free pages are reused for new rows; run once with --vacuum to shrink the file")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    except sqlite3.Error as sql_e:
+        print(f"sqlite error occurred: {sql_e}")
+        raise
+    finally:
+        conn.close()
+    size_after = file_size(path)
+    print(f"released {released} pages ({released * page_size / 1e6:.1f} MB), "
+          f"{path}: {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB "
+          f"({(size_before - size_after) / 1e6:.1f} MB reclaimed)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete sensor readings past their retention and reclaim the space")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows deleted per transaction")
+    parser.add_argument("--pause-ms", type=int, default=20, help="pause between batches for the ingester")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="full VACUUM that also enables incremental vacuum on older databases")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    migrate(args.db)
+    apply(args.db, RETENTION, args.batch_size, args.pause_ms / 1000, args.vacuum, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import sqlite3
+import partitions
+from rooms import ROOMS
+
+# Pre-aggregated rollup tables, one per room and resolution (e.g. stue_1h).
+# Each bucket row holds count, last_ts and min/max/sum/last of every metric.
+# The ingester upserts them together with the raw rows, and long time windows
+# are read from the coarsest rollup that still gives enough points.
+
+RESOLUTIONS = [("1m", 60_000), ("1h", 3_600_000), ("1d", 86_400_000)]
+AGGREGATES = ("min", "max", "sum", "last")
+
+
+class Rollup:
+    def __init__(self, room, name, bucket_ms):
+        self.room = room
+        self.name = name
+        self.bucket_ms = bucket_ms
+        self.table = f"{room.table}_{name}"
+        self.metrics = [f"{column}_{aggregate}" for column in room.columns for aggregate in AGGREGATES]
+        metrics = ", ".join(self.metrics)
+
+        self.create_query = (f"CREATE TABLE IF NOT EXISTS {self.table} (bucket INTEGER PRIMARY KEY, "
+                             "count INTEGER NOT NULL, last_ts INTEGER NOT NULL, "
+                             + ", ".join(f"{metric} REAL NOT NULL" for metric in self.metrics) + ")")
+
+        # One reading at a time; SET expressions see the row as it was before
+        # the update, so "last" is taken from whichever reading is newest.
+        updates = ["count = count + excluded.count"]
+        for column in room.columns:
+            updates += [f"{column}_min = min({column}_min, excluded.{column}_min)",
+                        f"{column}_max = max({column}_max, excluded.{column}_max)",
+                        f"{column}_sum = {column}_sum + excluded.{column}_sum",
+                        f"{column}_last = CASE WHEN excluded.last_ts >= last_ts "
+                        f"THEN excluded.{column}_last ELSE {column}_last END"]
+        updates.append("last_ts = max(last_ts, excluded.last_ts)")
+        self.upsert_query = (f"INSERT INTO {self.table} (bucket, count, last_ts, {metrics}) "
+                             f"VALUES(?, 1, ?, {', '.join('?' for metric in self.metrics)}) "
+                             f"ON CONFLICT(bucket) DO UPDATE SET {', '.join(updates)}")
+
+        groups = ", ".join(f"min({column}) AS {column}_min, max({column}) AS {column}_max, sum({column}) AS {column}_sum"
+                           for column in room.columns)
+        picks = ", ".join(f"g.{column}_min, g.{column}_max, g.{column}_sum, r.{column}" for column in room.columns)
+        # Rebuilds the buckets of since_ts <= ts < until_ts from one partition of
+        # raw rows, after rows were bulk loaded or deleted there. Formatted with
+        # the partition's table; every bucket lies inside a single partition.
+        self.delete_range_query = f"DELETE FROM {self.table} WHERE bucket >= ? AND bucket < ?"
+        self.backfill_query = (f"INSERT INTO {self.table} (bucket, count, last_ts, {metrics}) "
+                               f"SELECT g.bucket, g.count, g.last_ts, {picks} FROM "
+                               f"(SELECT ts - ts % {bucket_ms} AS bucket, count(*) AS count, max(ts) AS last_ts, {groups} "
+                               "FROM {table} WHERE ts >= ? AND ts < ? GROUP BY bucket) AS g "
+                               "JOIN {table} AS r ON r.rowid = "
+                               "(SELECT rowid FROM {table} WHERE ts = g.last_ts LIMIT 1)")
+
+        self.select_query = (f"SELECT bucket, count, last_ts, {metrics} FROM {self.table} "
+                             "WHERE bucket >= ? AND bucket < ? ORDER BY bucket")
+        self.record_fields = [("bucket", "i8"), ("count", "i8"), ("last_ts", "i8")] + [(metric, "f8") for metric in self.metrics]
+
+    def row(self, ts, values):
+        return (ts - ts % self.bucket_ms, ts) + tuple(value for value in values for aggregate in AGGREGATES)
+
+
+rollups_by_room = {room.name: [Rollup(room, name, bucket_ms) for name, bucket_ms in RESOLUTIONS] for room in ROOMS}
+
+
+# Coarsest rollup whose buckets are still small enough to give max_points
+# points over the window, or None if the raw rows are needed.
+def pick_rollup(room_name, window_ms, max_points):
+    best = None
+    for rollup in rollups_by_room[room_name]:
+        if rollup.bucket_ms * max_points <= window_ms:
+            best = rollup
+    return best
+
+
+def create_rollup_tables(conn):
+    for rollups in rollups_by_room.values():
+        for rollup in rollups:
+            conn.execute(rollup.create_query)
+
+
+# Rebuilds every rollup table from the raw rows. Buckets older than the
+# oldest raw row are kept, since retention.py deletes raw rows once they are
+# only needed as rollups.
+def backfill(conn):
+    for room_name, rollups in rollups_by_room.items():
+        room = rollups[0].room
+        oldest_ts, newest_ts = partitions.oldest_ts(conn, room), partitions.newest_ts(conn, room)
+        if oldest_ts is None:
+            continue
+        print(f"building {', '.join(rollup.table for rollup in rollups)}")
+        rebuild_range(conn, room_name, oldest_ts, newest_ts + 1)
+
+
+# Rebuilds the buckets of one room that cover since_ts <= ts < until_ts.
+def rebuild_range(conn, room_name, since_ts, until_ts):
+    room = rollups_by_room[room_name][0].room
+    for rollup in rollups_by_room[room_name]:
+        since = since_ts - since_ts % rollup.bucket_ms
+        until = until_ts - until_ts % rollup.bucket_ms + rollup.bucket_ms
+        conn.execute(rollup.delete_range_query, (since, until))
+        for partition in partitions.overlapping(conn, room, since, until):
+            conn.execute(rollup.backfill_query.format(table=partition.table), (since, until))
+
+
+if __name__ == "__main__":
+    from migrate_db import DB_PATH, migrate
+    migrate()
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        with conn:
+            backfill(conn)
+    except sqlite3.Error as sql_e:
+        print(f"sqlite error occurred: {sql_e}")
+    finally:
+        conn.close()
@@ -0,0 +1,83 @@
+import math
+from operator import itemgetter
+
+# Declarative room registry. Each room maps an MQTT topic to its monthly
+# partition tables, and each field maps a column to the key the ESP uses in its
+# JSON payload. Adding
+# a room is one entry here: the ingester, readers and schema are driven by it.
+
+
+def make_extractor(keys):
+    if len(keys) == 1:
+        key = keys[0]
+        get = lambda data: (data[key],)
+    else:
+        get = itemgetter(*keys)
+
+    # Only finite numbers are readings; None, booleans and strings such as
+    # "err" from a failed sensor would otherwise end up in the REAL columns.
+    def extract(data):
+        values = get(data)
+        for key, value in zip(keys, values):
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                raise ValueError(f"{key} is not a number: {value!r}")
+        return values
+    return extract
+
+
+# The queries of one physical table holding readings of a room. Rooms are
+# stored in monthly partitions (partitions.py), each one such table.
+class RoomTable:
+    def __init__(self, table, columns):
+        self.table = table
+        self.index_name = f"idx_{table}_ts"
+        names = ", ".join(columns)
+        placeholders = ", ".join("?" for column in columns)
+        self.insert_query = f"INSERT INTO {table} (datetime, ts, {names}) VALUES(?, ?, {placeholders})"
+        # Same parameters plus the ts once more; skips readings already stored.
+        self.insert_new_query = (f"INSERT INTO {table} (datetime, ts, {names}) SELECT ?, ?, {placeholders} "
+                                 f"WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE ts = ?)")
+        self.select_query = f"SELECT datetime, {names} FROM {table} ORDER BY ts DESC LIMIT ?"
+        self.columns_query = f"SELECT ts, {names} FROM {table} ORDER BY ts DESC LIMIT ?"
+        self.since_query = f"SELECT datetime, {names} FROM {table} WHERE ts > ? ORDER BY ts DESC LIMIT ?"
+        self.since_columns_query = f"SELECT ts, {names} FROM {table} WHERE ts > ? ORDER BY ts DESC LIMIT ?"
+        self.window_query = f"SELECT ts, {names} FROM {table} WHERE ts >= ? AND ts < ? ORDER BY ts"
+        self.export_query = f"SELECT datetime, ts, {names} FROM {table} WHERE ts > ? ORDER BY ts"
+        self.create_query = (f"CREATE TABLE IF NOT EXISTS {table} (datetime TEXT NOT NULL, "
+                             + "".join(f"{column} REAL NOT NULL, " for column in columns)
+                             + "ts INTEGER)")
+        self.index_query = f"CREATE INDEX IF NOT EXISTS {self.index_name} ON {table} (ts DESC)"
+        # Scalar subquery returning the newest row as a JSON object, so the
+        # latest reading of every room can be fetched in one statement.
+        self.latest_subquery = (f"(SELECT json_object('datetime', datetime, 'ts', ts, "
+                                + ", ".join(f"'{column}', {column}" for column in columns)
+                                + f") FROM {table} ORDER BY ts DESC LIMIT 1)")
+
+
+class Room:
+    def __init__(self, name, topic, table, fields):
+        self.name = name
+        self.topic = topic
+        # Name the partition tables are derived from, e.g. stue_p202610.
+        self.table = table
+        self.columns = [column for column, key in fields]
+        self.keys = [key for column, key in fields]
+        self.record_fields = [("ts", "i8")] + [(column, "f8") for column in self.columns]
+        self.extract = make_extractor(self.keys)
+
+
+ROOMS = [
+    Room("stue", "sensor/stue/json", "stue",
+         [("temperature", "temp"), ("humidity", "rh"), ("tvoc", "tvoc"), ("particles", "pm"), ("co2", "co2")]),
+    Room("bath", "sensor/bad/json", "bad",
+         [("temperature", "temp"), ("humidity", "hum"), ("battery", "bat")]),
+    Room("bedroom", "sensor/bedroom/json", "bedroom",
+         [("temperature", "temp"), ("humidity", "hum"), ("battery", "bat")]),
+]
+
+# The ingester publishes every committed batch of readings here as a JSON list
+# of {"room", "ts", <columns>} objects, oldest first.
+LIVE_TOPIC = "ingest/readings"
+
+rooms_by_name = {room.name: room for room in ROOMS}
+rooms_by_topic = {room.topic: room for room in ROOMS}
@@ -0,0 +1,245 @@
+import json
+import operator
+import sqlite3
+import threading
+import time
+from datetime import datetime
+import paho.mqtt.client as mqtt
+import db_writer
+from migrate_db import DB_PATH, TIME_FORMAT
+from rooms import rooms_by_name
+
+# Declarative climate rules. An actuator is anything switched on and off by an
+# MQTT command (a fan, a dehumidifier, a pump) that confirms its state on
+# <topic>/state once it has switched; a rule votes on one actuator:
+#
+#   on   conditions of which any one switches it on
+#   off  conditions of which any one switches it off
+#
+# and has no opinion otherwise, so an on/off pair over one metric is a
+# hysteresis band (Rule.band). Per actuator the highest priority rule with an
+# opinion decides, and among equal priorities "on" wins. Actuators keep a state
+# for at least min_on / min_off seconds. Conditions are (room, column, op,
+# threshold) over the rooms registry.
+#
+# The engine indexes rules by the metric they read, so a reading only
+# re-evaluates the rules whose inputs changed. Every actuation is written to
+# the actuations table together with the rule and reading that caused it.
+
+OPERATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+
+class Condition:
+    def __init__(self, room_name, column, op, threshold):
+        room = rooms_by_name.get(room_name)
+        if room is None or column not in room.columns:
+            raise ValueError(f"Unknown metric {room_name}.{column}")
+        if op not in OPERATORS:
+            raise ValueError(f"Unknown operator {op!r}, expected one of {list(OPERATORS)}")
+        self.key = (room_name, column)
+        self.test = OPERATORS[op]
+        self.threshold = threshold
+        self.text = f"{room_name}.{column} {op} {threshold}"
+
+    def holds(self, values):
+        value = values.get(self.key)
+        return value is not None and self.test(value, self.threshold)
+
+
+class Actuator:
+    def __init__(self, name, topic, on_payload="1", off_payload="0", min_on=0, min_off=0, state_topic=None):
+        self.name = name
+        self.topic = topic
+        self.state_topic = state_topic or f"{topic}/state"
+        self.on_payload = on_payload
+        self.off_payload = off_payload
+        self.min_on = min_on
+        self.min_off = min_off
+        self.rules = []
+        self.state = None
+        self.changed_at = float("-inf")
+
+    # True/False for an on/off payload on the command or state topic, else None.
+    def parse(self, payload):
+        payload = payload.decode(errors="replace") if isinstance(payload, bytes) else payload
+        return {self.on_payload: True, self.off_payload: False}.get(payload)
+
+    # The rule that decides the actuator's state right now, or None.
+    def decision(self):
+        decision = None
+        for rule in self.rules:
+            if decision is not None and rule.priority < decision.priority:
+                break
+            if rule.vote is not None and (decision is None or (rule.vote and not decision.vote)):
+                decision = rule
+        return decision
+
+
+class Rule:
+    def __init__(self, name, actuator, on=(), off=(), priority=0):
+        self.name = name
+        self.actuator = actuator
+        self.on = [Condition(*condition) for condition in on]
+        self.off = [Condition(*condition) for condition in off]
+        self.priority = priority
+        self.keys = {condition.key for condition in self.on + self.off}
+        self.vote = None
+        self.reason = None
+
+    # Switches on above on_above and off below off_below.
+    @classmethod
+    def band(cls, name, actuator, room_name, column, off_below, on_above, priority=0):
+        if off_below >= on_above:
+            raise ValueError(f"{name}: off_below must be lower than on_above")
+        return cls(name, actuator, on=[(room_name, column, ">", on_above)],
+                   off=[(room_name, column, "<", off_below)], priority=priority)
+
+    def evaluate(self, values):
+        for vote, conditions in ((True, self.on), (False, self.off)):
+            for condition in conditions:
+                if condition.holds(values):
+                    self.vote = vote
+                    self.reason = f"{condition.text} ({values[condition.key]})"
+                    return
+        self.vote = None
+        self.reason = None
+
+
+ACTUATORS = [
+    Actuator("stue_fan", "sensor/stue/fan"),
+]
+
+actuators_by_name = {actuator.name: actuator for actuator in ACTUATORS}
+
+RULES = [
+    Rule.band("stue humidity", "stue_fan", "stue", "humidity", off_below=30, on_above=50),
+    Rule.band("stue co2", "stue_fan", "stue", "co2", off_below=700, on_above=1100),
+]
+
+AUDIT_QUERY = "INSERT INTO actuations (datetime, ts, actuator, state, rule, reason) VALUES(?, ?, ?, ?, ?, ?)"
+
+
+class RuleEngine:
+    def __init__(self, rules=RULES, actuators=ACTUATORS, hostname="localhost", port=1883, path=DB_PATH):
+        self.actuators = {actuator.name: actuator for actuator in actuators}
+        self.by_metric = {}
+        for rule in rules:
+            actuator = self.actuators.get(rule.actuator)
+            if actuator is None:
+                raise ValueError(f"Rule {rule.name!r} switches unknown actuator {rule.actuator!r}")
+            actuator.rules.append(rule)
+            for key in rule.keys:
+                self.by_metric.setdefault(key, []).append(rule)
+        for actuator in self.actuators.values():
+            actuator.rules.sort(key=lambda rule: -rule.priority)
+        self.rooms_by_topic = {rooms_by_name[room_name].topic: rooms_by_name[room_name]
+                               for room_name, column in self.by_metric}
+        self.actuators_by_topic = {topic: actuator for actuator in self.actuators.values()
+                                   for topic in (actuator.topic, actuator.state_topic)}
+
+        self.values = {}
+        self.held = set()
+        self.lock = threading.Lock()
+        self.hostname = hostname
+        self.port = port
+        self.path = path
+        self.conn = None
+        self.client = None
+
+    # Applies one reading {column: value} of a room and returns the actuations
+    # [(actuator, state, rule)] it caused.
+    def on_reading(self, room_name, reading, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            rules = set()
+            for column, value in reading.items():
+                key = (room_name, column)
+                if self.values.get(key) != value:
+                    self.values[key] = value
+                    rules.update(self.by_metric.get(key, ()))
+            actuators = set()
+            for rule in rules:
+                rule.evaluate(self.values)
+                actuators.add(self.actuators[rule.actuator])
+            return [actuation for actuator in actuators for actuation in self.resolve(actuator, now)]
+
+    # Re-checks actuators that were held back by their minimum on/off time.
+    def tick(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            held, self.held = self.held, set()
+            return [actuation for actuator in held for actuation in self.resolve(actuator, now)]
+
+    # A command on an actuator's topic from anywhere else (the web buttons), or
+    # the state the device confirms on its state topic.
+    def on_command(self, actuator, state, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if actuator.state != state:
+                actuator.state = state
+                actuator.changed_at = now
+
+    def resolve(self, actuator, now):
+        rule = actuator.decision()
+        if rule is None or rule.vote == actuator.state:
+            return []
+        hold = actuator.min_on if actuator.state else actuator.min_off
+        if actuator.state is not None and now - actuator.changed_at < hold:
+            self.held.add(actuator)
+            return []
+        actuator.state = rule.vote
+        actuator.changed_at = now
+        self.actuate(actuator, rule)
+        return [(actuator, rule.vote, rule)]
+
+    def actuate(self, actuator, rule):
+        print(f"{actuator.name} {'on' if rule.vote else 'off'}: {rule.name}, {rule.reason}")
+        if self.client is not None:
+            self.client.publish(actuator.topic, actuator.on_payload if rule.vote else actuator.off_payload, qos=1)
+        if self.conn is not None:
+            now = datetime.now()
+            try:
+                with self.conn:
+                    self.conn.execute(AUDIT_QUERY, (now.strftime(TIME_FORMAT), int(now.timestamp() * 1000),
+                                                    actuator.name, int(rule.vote), rule.name, rule.reason))
+            except sqlite3.Error as sql_e:
+                print(f"sqlite error occurred: {sql_e}")
+
+    def on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            print(f"MQTT connect failed: {reason_code}")
+            return
+        client.subscribe([(topic, 0) for topic in self.rooms_by_topic]
+                         + [(topic, 1) for topic in self.actuators_by_topic])
+
+    def on_message(self, client, userdata, message):
+        actuator = self.actuators_by_topic.get(message.topic)
+        if actuator is not None:
+            state = actuator.parse(message.payload)
+            if state is not None:
+                self.on_command(actuator, state)
+            return
+        room = self.rooms_by_topic[message.topic]
+        try:
+            reading = dict(zip(room.columns, room.extract(json.loads(message.payload))))
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Bad payload on {message.topic}: {e}")
+            return
+        self.on_reading(room.name, reading)
+
+    def run(self, tick_interval=1):
+        self.conn = db_writer.connect(self.path)
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        self.client.reconnect_delay_set(min_delay=1, max_delay=60)
+        self.client.connect_async(self.hostname, self.port)
+        self.client.loop_start()
+        try:
+            while True:
+                time.sleep(tick_interval)
+                self.tick()
+        finally:
+            self.client.disconnect()
+            self.client.loop_stop()
+            self.conn.close()
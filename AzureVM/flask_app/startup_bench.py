@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Cold-start cost of every service entry point, since systemd restarts them
+# often. Each run imports the entry point in a fresh interpreter under
+# `python -X importtime` and reports the median wall time, the time spent
+# importing it, and the slowest modules it pulled in. Importing an entry point
+# must do no work (no queries, no connections, no matplotlib): --forbid fails
+# the run when one of the given modules gets imported anyway.
+#
+#   python startup_bench.py
+#   python startup_bench.py --runs 10 --top 5 --history database/startup.jsonl
+
+ENTRY_POINTS = {
+    "web": "app",
+    "fan": "fan",
+    "logger": "log_data",
+    "rollups": "rollups",
+    "migrate": "migrate_db",
+}
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# Parses -X importtime output into [(name, self_us, cumulative_us, depth)].
+def parse_importtime(stderr):
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def measure(module):
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}" if module else "pass"],
+                          cwd=HERE, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr.strip().splitlines()[-1]}")
+    imports = parse_importtime(proc.stderr)
+    import_ms = sum(cumulative for name, self_us, cumulative, depth in imports if name == module and depth == 0) / 1000
+    return wall_ms, import_ms, imports
+
+
+# Median over runs of one entry point, with the imports of its median run.
+def bench(module, runs):
+    results = sorted((measure(module) for i in range(runs)), key=lambda result: result[0])
+    wall_ms, import_ms, imports = results[len(results) // 2]
+    return {
+        "wall_ms": round(statistics.median(result[0] for result in results), 1),
+        "import_ms": round(statistics.median(result[1] for result in results), 1),
+        "modules": len(imports),
+        "imported": {name for name, self_us, cumulative, depth in imports},
+        "slowest": sorted(((name, self_us / 1000) for name, self_us, cumulative, depth in imports),
+                          key=lambda item: -item[1]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the cold-start import cost of every entry point")
+    parser.add_argument("entry_points", nargs="*", metavar="entry_point",
+                        help=f"entry points to measure ({', '.join(ENTRY_POINTS)}), all by default")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per entry point")
+    parser.add_argument("--top", type=int, default=3, help="slowest modules listed per entry point")
+    parser.add_argument("--forbid", default="matplotlib", help="comma separated modules no entry point may import")
+    parser.add_argument("--history", help="JSON lines file every run is appended to, for tracking over time")
+    args = parser.parse_args()
+    for name in args.entry_points:
+        if name not in ENTRY_POINTS:
+            parser.error(f"unknown entry point {name!r}, expected one of {list(ENTRY_POINTS)}")
+
+    forbidden = [name for name in args.forbid.split(",") if name]
+    baseline = statistics.median(measure(None)[0] for i in range(args.runs))
+    print(f"{'entry point':<12} {'wall ms':>8} {'import ms':>10} {'modules':>8}  slowest modules (self ms)")
+    print(f"{'python':<12} {baseline:>8.1f} {0:>10.1f} {'':>8}")
+    report = {"time": int(time.time()), "python_ms": round(baseline, 1), "entry_points": {}}
+    violations = []
+    for name in args.entry_points or ENTRY_POINTS:
+        result = bench(ENTRY_POINTS[name], args.runs)
+        slowest = ", ".join(f"{module} {ms:.1f}" for module, ms in result["slowest"][:args.top])
+        print(f"{name:<12} {result['wall_ms']:>8.1f} {result['import_ms']:>10.1f} {result['modules']:>8}  {slowest}")
+        violations += [(name, module) for module in forbidden if module in result["imported"]]
+        report["entry_points"][name] = {key: result[key] for key in ("wall_ms", "import_ms", "modules")}
+
+    if args.history:
+        with open(args.history, "a") as f:
+            f.write(json.dumps(report) + "\n")
+    for name, module in violations:
+        print(f"{name} imports {module} at startup")
+    if violations:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+// Client-side charts for IndeklimaKontrol. Pages load their data once as
+// compact JSON from /api and then follow /api/stream (Server-Sent Events),
+// which only pushes new readings. EventSource reconnects by itself and the
+// server replays what was missed from the Last-Event-ID. The same stream
+// carries the state actuators (the fan) confirm, shown by showActuator().
+
+const MAX_POINTS = 1000;
+const STREAM_RETRY_MS = 10000;
+const WINDOW_UNITS = {m: 60e3, h: 3600e3, d: 86400e3, w: 604800e3};
+const actuatorViews = {};
+
+function pad(number) {
+    return String(number).padStart(2, "0");
+}
+
+function formatTime(ms) {
+    const d = new Date(ms);
+    return `${pad(d.getDate())}/${pad(d.getMonth() + 1)}/${String(d.getFullYear()).slice(2)} ` +
+        `${pad(d.getHours())}:${pad(d.getMinutes())}`;
+}
+
+function windowMs(text) {
+    return text ? parseInt(text, 10) * WINDOW_UNITS[text.slice(-1)] : null;
+}
+
+function follow(rooms, since, onReading) {
+    const query = new URLSearchParams({rooms: rooms.join(",")});
+    if (since) {
+        query.set("since", since);
+    }
+    const source = new EventSource(`/api/stream?${query}`);
+    let last = since;
+    source.addEventListener("reading", (event) => {
+        const reading = JSON.parse(event.data);
+        last = Math.max(last || 0, reading.ts);
+        onReading(reading);
+    });
+    // A server with all its stream slots taken answers 503, after which the
+    // browser gives up; try again later from the last reading seen.
+    source.addEventListener("error", () => {
+        if (source.readyState === EventSource.CLOSED) {
+            setTimeout(() => follow(rooms, last, onReading), STREAM_RETRY_MS);
+        }
+    });
+    source.addEventListener("actuator", (event) => {
+        const update = JSON.parse(event.data);
+        (actuatorViews[update.actuator] || []).forEach((view) => view(update.state));
+    });
+    return source;
+}
+
+function showState(element, state) {
+    element.textContent = state === null ? "unknown" : state ? "on" : "off";
+    element.className = `badge ${state === null ? "bg-secondary" : state ? "bg-success" : "bg-dark"}`;
+}
+
+// Shows the state an actuator last confirmed in the element elementId, kept
+// current by the stream of the page's charts. Its command forms (class
+// forms) are sent in the background; the element reads "sent" until the
+// actuator confirms.
+async function showActuator(name, elementId, forms) {
+    const element = document.getElementById(elementId);
+    (actuatorViews[name] = actuatorViews[name] || []).push((state) => showState(element, state));
+    document.querySelectorAll(`form.${forms}`).forEach((form) => form.addEventListener("submit", async (event) => {
+        event.preventDefault();
+        const response = await fetch(form.action, {method: "POST", headers: {Accept: "application/json"}});
+        if (response.ok) {
+            element.textContent = "sent";
+        } else {
+            element.textContent = "no connection";
+            element.className = "badge bg-danger";
+        }
+    }));
+    const response = await fetch("/api/actuators");
+    const states = await response.json();
+    if (element.textContent === "") {
+        showState(element, states[name]);
+    }
+}
+
+function lineChart(canvas, label, showTimes) {
+    return new Chart(canvas, {
+        type: "line",
+        data: {datasets: [{label: label, data: [], borderColor: "#11f", borderWidth: 1.5, pointRadius: 0}]},
+        options: {
+            animation: false,
+            parsing: false,
+            plugins: {legend: {display: false}, title: {display: true, text: label}},
+            scales: {
+                x: {type: "linear", ticks: {display: showTimes, maxRotation: 90, minRotation: 90,
+                                            callback: (value) => formatTime(value)}},
+                y: {grid: {borderDash: [4, 4]}},
+            },
+        },
+    });
+}
+
+// panels: [{canvas: "id", field: "temperature", label: "Temp in C"}, ...]
+async function drawRoom(room, panels) {
+    const page = new URLSearchParams(window.location.search);
+    const span = windowMs(page.get("window"));
+    const query = new URLSearchParams({fields: panels.map((panel) => panel.field).join(",")});
+    if (page.get("window")) {
+        query.set("window", page.get("window"));
+    }
+    if (page.get("resolution")) {
+        query.set("max_points", page.get("resolution"));
+    }
+    const charts = panels.map((panel, i) =>
+        lineChart(document.getElementById(panel.canvas), panel.label, i === panels.length - 1));
+
+    const response = await fetch(`/api/${room}/series?${query}`);
+    const payload = await response.json();
+    panels.forEach((panel, i) => {
+        const series = payload.fields[panel.field];
+        charts[i].data.datasets[0].data = series.t.map((t, j) => ({x: t, y: series.v[j]}));
+        charts[i].update();
+    });
+
+    // payload.cursor is the newest reading served; the chart times of a
+    // min/max envelope can lie past it.
+    follow([room], payload.cursor, (reading) => {
+        panels.forEach((panel, i) => {
+            const points = charts[i].data.datasets[0].data;
+            points.push({x: reading.ts, y: reading[panel.field]});
+            while (points.length > 0 && (span ? points[0].x < reading.ts - span : points.length > MAX_POINTS)) {
+                points.shift();
+            }
+            charts[i].update();
+        });
+    });
+}
+
+// groups: [{canvas: "id", label: "Humidity", bars: [{label: "Bath", room: "bath", field: "humidity"}, ...]}, ...]
+async function drawLatest(groups) {
+    const charts = groups.map((group) => new Chart(document.getElementById(group.canvas), {
+        type: "bar",
+        data: {labels: group.bars.map((bar) => bar.label), datasets: [{label: group.label, data: []}]},
+        options: {animation: false, plugins: {legend: {display: false}, title: {display: true, text: group.label}}},
+    }));
+
+    const response = await fetch("/api/latest");
+    const latest = await response.json();
+    const rooms = Object.keys(latest);
+    let last = 0;
+    for (const room of rooms) {
+        last = Math.max(last, latest[room] ? latest[room].ts : 0);
+    }
+
+    function redraw() {
+        groups.forEach((group, i) => {
+            charts[i].data.datasets[0].data = group.bars.map((bar) =>
+                latest[bar.room] ? latest[bar.room][bar.field] : null);
+            charts[i].update();
+        });
+    }
+    redraw();
+
+    follow(rooms, last, (reading) => {
+        latest[reading.room] = reading;
+        redraw();
+    });
+}
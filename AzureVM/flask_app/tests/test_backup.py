@@ -0,0 +1,56 @@
+import os
+import sqlite3
+import pytest
+import backup
+
+
+def make_database(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS readings (ts INTEGER, value REAL)")
+    conn.executemany("INSERT INTO readings VALUES (?, ?)", ((i, i * 0.5) for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def contents(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT * FROM readings ORDER BY ts").fetchall()
+    finally:
+        conn.close()
+
+
+def test_backup_and_restore(tmp_path):
+    db, target = str(tmp_path / "data.db"), str(tmp_path / "backup")
+    make_database(db, 5000)
+    first = backup.backup(db, target, chunk_pages=4, level=1)
+    make_database(db, 10)
+    second = backup.backup(db, target, chunk_pages=4, level=1)
+    assert first != second
+    assert backup.snapshots(target) == sorted([first, second])
+
+    backup.restore(target, first, str(tmp_path / "first.db"))
+    backup.restore(target, second, str(tmp_path / "second.db"))
+    assert len(contents(tmp_path / "first.db")) == 5000
+    assert contents(tmp_path / "second.db") == contents(db)
+
+
+def test_restore_detects_corrupt_chunk(tmp_path):
+    db, target = str(tmp_path / "data.db"), str(tmp_path / "backup")
+    make_database(db, 100)
+    name = backup.backup(db, target, chunk_pages=4, level=1)
+    digest = backup.load_snapshot(target, name)["chunks"][0]
+    with open(backup.chunk_path(target, digest), "wb") as f:
+        f.write(__import__("zlib").compress(b"not the page"))
+    with pytest.raises(ValueError):
+        backup.restore(target, name, str(tmp_path / "restored.db"))
+    assert not os.path.exists(tmp_path / "restored.db")
+
+
+def test_snapshot_manifest_is_never_overwritten(tmp_path):
+    path = str(tmp_path / "snapshots" / "20261018T101500000Z.json")
+    backup.write_new(path, b"first")
+    with pytest.raises(FileExistsError):
+        backup.write_new(path, b"second")
+    with open(path, "rb") as f:
+        assert f.read() == b"first"
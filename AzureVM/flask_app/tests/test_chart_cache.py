@@ -0,0 +1,21 @@
+from chart_cache import cached_chart, chart_cache
+
+
+class Context:
+    def latest_timestamps(self, rooms):
+        return (1,)
+
+
+def test_defaults_and_explicit_arguments_share_an_entry():
+    renders = []
+
+    @cached_chart(("test",))
+    def chart(ctx, window=None, fmt="png", dpi=None):
+        renders.append((window, fmt, dpi))
+        return b"image"
+
+    chart_cache.clear()
+    chart(Context(), None, "webp")
+    chart(Context(), None, "webp", None)
+    chart(Context(), fmt="webp")
+    assert renders == [(None, "webp", None)]
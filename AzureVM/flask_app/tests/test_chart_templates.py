@@ -0,0 +1,9 @@
+import chart_templates
+
+
+def test_bar_chart_draws_an_empty_bar_for_a_room_without_readings():
+    latest = {"bedroom": None, "bath": {"battery": 80.0}, "stue": None}
+    for fmt in ("png", "svg"):
+        assert chart_templates.render("bat_stat", latest, fmt)
+    colored = {"bath": None, "bedroom": {"humidity": 40.0}, "stue": {"humidity": 55.0}}
+    assert chart_templates.render("humidity_realtime", colored, "png")
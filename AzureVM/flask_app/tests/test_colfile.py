@@ -0,0 +1,34 @@
+import io
+import numpy as np
+import pytest
+from colfile import ColumnReader, ColumnWriter
+from rooms import rooms_by_name
+
+room = rooms_by_name["bath"]
+
+
+def test_round_trip_over_chunks():
+    ts = np.arange(1_700_000_000_000, 1_700_000_000_000 + 250 * 10_000, 10_000, dtype=np.int64)
+    fields = {column: np.random.default_rng(1).normal(20, 5, len(ts)) for column in room.columns}
+    datetimes = [str(t) for t in ts]
+    f = io.BytesIO()
+    writer = ColumnWriter(f, room)
+    for start in range(0, len(ts), 100):
+        writer.write_chunk(datetimes[start:start + 100], ts[start:start + 100],
+                           {column: values[start:start + 100] for column, values in fields.items()})
+    assert writer.rows == len(ts)
+
+    f.seek(0)
+    reader = ColumnReader(f)
+    assert reader.header["room"] == "bath" and reader.header["columns"] == room.columns
+    chunks = list(reader)
+    assert [len(chunk_ts) for _, chunk_ts, _ in chunks] == [100, 100, 50]
+    assert sum((chunk_datetimes for chunk_datetimes, _, _ in chunks), []) == datetimes
+    assert np.array_equal(np.concatenate([chunk_ts for _, chunk_ts, _ in chunks]), ts)
+    for column in room.columns:
+        assert np.array_equal(np.concatenate([chunk[column] for _, _, chunk in chunks]), fields[column])
+
+
+def test_rejects_other_files():
+    with pytest.raises(ValueError):
+        ColumnReader(io.BytesIO(b"SQLite format 3\x00"))
@@ -0,0 +1,35 @@
+import os
+import sqlite3
+import db_writer
+
+SCHEMA = ["CREATE TABLE IF NOT EXISTS readings (ts INTEGER, value REAL NOT NULL)"]
+QUERY = "INSERT INTO readings VALUES (?, ?)"
+
+
+def test_constraint_failure_skips_only_the_bad_row(tmp_path):
+    conn = db_writer.connect(str(tmp_path / "data.db"))
+    status, skipped = db_writer.write_batch(conn, {QUERY: [(1, 20.0), (2, None), (3, 21.0)]}, SCHEMA)
+    assert status == db_writer.COMMITTED
+    assert skipped == [(QUERY, (2, None))]
+    assert conn.execute("SELECT ts FROM readings ORDER BY ts").fetchall() == [(1,), (3,)]
+
+
+def test_batch_is_retried_while_another_connection_holds_the_lock(tmp_path):
+    path = str(tmp_path / "data.db")
+    conn = db_writer.connect(path)
+    db_writer.write_batch(conn, {}, SCHEMA)
+    conn.execute("PRAGMA busy_timeout = 0")
+    other = sqlite3.connect(path)
+    other.execute("BEGIN IMMEDIATE")
+    assert db_writer.write_batch(conn, {QUERY: [(1, 20.0)]}) == (db_writer.RETRY, [])
+    other.rollback()
+    assert db_writer.write_batch(conn, {QUERY: [(1, 20.0)]}) == (db_writer.COMMITTED, [])
+
+
+def test_permanent_errors_drop_the_batch(tmp_path):
+    path = str(tmp_path / "data.db")
+    db_writer.write_batch(db_writer.connect(path), {}, SCHEMA)
+    assert db_writer.write_batch(db_writer.connect(path), {"INSERT INTO missing VALUES (?)": [(1,)]}) == (db_writer.DROPPED, [])
+    os.chmod(path, 0o444)
+    readonly = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    assert db_writer.write_batch(readonly, {QUERY: [(1, 20.0)]}) == (db_writer.DROPPED, [])
@@ -0,0 +1,19 @@
+import numpy as np
+from downsample import lttb_indices, minmax_indices
+
+
+def test_minmax_keeps_spikes():
+    y = np.zeros(10_000)
+    y[1234] = 100
+    y[8765] = -100
+    indices = minmax_indices(y, 100)
+    assert len(indices) <= 100
+    assert 1234 in indices and 8765 in indices
+
+
+def test_lttb_keeps_endpoints():
+    x = np.arange(1000)
+    indices = lttb_indices(x, np.sin(x / 50), 50)
+    assert len(indices) == 50
+    assert indices[0] == 0 and indices[-1] == 999
+    assert (np.diff(indices) > 0).all()
@@ -0,0 +1,29 @@
+import numpy as np
+from get_data import Series
+
+HOUR = 3_600_000
+
+
+def buckets(starts, last_ts, low, high):
+    return Series(np.array(starts, dtype=np.int64),
+                  {"last_ts": np.array(last_ts, dtype=np.int64),
+                   "temperature_min": np.array(low, dtype=float),
+                   "temperature_max": np.array(high, dtype=float)})
+
+
+def test_envelope_places_min_at_start_and_max_mid_bucket():
+    envelope = buckets([0, HOUR], [HOUR - 1, 2 * HOUR - 1], [1, 2], [5, 6]).envelope(["temperature"], HOUR)
+    assert envelope.ts.tolist() == [0, HOUR // 2, HOUR, HOUR + HOUR // 2]
+    assert envelope["temperature"].tolist() == [1, 5, 2, 6]
+
+
+def test_envelope_never_places_max_after_newest_reading():
+    envelope = buckets([0, HOUR], [HOUR - 1, HOUR + 60_000], [1, 2], [5, 6]).envelope(["temperature"], HOUR)
+    assert envelope.ts[-1] == HOUR + 60_000
+    assert (envelope.ts[0::2] <= envelope.ts[1::2]).all()
+
+
+def test_tail():
+    series = Series(np.arange(5, dtype=np.int64), {"co2": np.arange(5.0)})
+    assert series.tail(2).ts.tolist() == [3, 4]
+    assert series.tail(2)["co2"].tolist() == [3.0, 4.0]
@@ -0,0 +1,75 @@
+import json
+import numpy as np
+import pytest
+from get_data import Series
+from hot_cache import HotCache, RingBuffer
+from live import LiveHub
+from rooms import rooms_by_name
+
+room = rooms_by_name["bath"]
+
+
+def reading(ts, temperature=20.0):
+    return {"room": "bath", "ts": ts, "temperature": temperature, "humidity": 50.0, "battery": 90.0}
+
+
+def test_ring_buffer_keeps_newest_in_order():
+    buffer = RingBuffer(room, 3)
+    for ts in range(1, 6):
+        buffer.append(reading(ts, temperature=ts))
+    series = buffer.series()
+    assert series.ts.tolist() == [3, 4, 5]
+    assert series["temperature"].tolist() == [3.0, 4.0, 5.0]
+    assert buffer.latest["ts"] == 5
+    assert not buffer.complete
+    assert buffer.covers(3) and not buffer.covers(2)
+
+
+def test_ring_buffer_ignores_readings_not_newer_than_latest():
+    buffer = RingBuffer(room, 3)
+    buffer.append(reading(2))
+    buffer.append(reading(1))
+    buffer.append(reading(2))
+    assert buffer.series().ts.tolist() == [2]
+
+
+@pytest.mark.parametrize("bad", [None, "err"])
+def test_ring_buffer_rejects_bad_reading_untouched(bad):
+    buffer = RingBuffer(room, 3)
+    buffer.append(reading(1))
+    with pytest.raises((TypeError, ValueError)):
+        buffer.append(reading(2, temperature=bad))
+    assert buffer.series().ts.tolist() == [1]
+    assert buffer.count == 1
+
+
+def test_ring_buffer_load_keeps_newer_live_readings():
+    buffer = RingBuffer(room, 10)
+    buffer.append(reading(5))
+    loaded = Series(np.array([1, 2], dtype=np.int64), {column: np.zeros(2) for column in room.columns})
+    buffer.load(loaded, complete=True)
+    assert buffer.series().ts.tolist() == [1, 2, 5]
+
+
+def test_hot_cache_skips_bad_reading_in_batch():
+    cache = HotCache(capacity=10)
+    cache.on_readings([reading(1), reading(2, temperature=None), reading(3)])
+    assert cache.buffers["bath"].series().ts.tolist() == [1, 3]
+
+
+class Message:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+def test_live_hub_survives_failing_listener():
+    hub = LiveHub()
+    received = []
+
+    def broken(readings):
+        raise ValueError("boom")
+    hub.listeners = [broken, received.extend]
+    hub.on_message(None, None, Message("ingest/readings", json.dumps([reading(1)]).encode()))
+    hub.on_message(None, None, Message("ingest/readings", b"5"))
+    assert [r["ts"] for r in received] == [1]
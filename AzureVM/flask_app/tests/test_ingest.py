@@ -0,0 +1,79 @@
+import asyncio
+import json
+import os
+from ingest import IngestService
+
+
+# An IngestService with its queue and events but without MQTT or SQLite.
+def service(tmp_path, policy, queue_size=2):
+    ingest = IngestService(path=str(tmp_path / "data.db"), queue_size=queue_size, policy=policy,
+                           spill_path=str(tmp_path / "spill.jsonl"))
+    ingest.loop = asyncio.get_running_loop()
+    ingest.queue = asyncio.Queue(queue_size)
+    ingest.stopping = asyncio.Event()
+    return ingest
+
+
+def item(i):
+    return ("sensor/bad/json", i, b'{"temp": 1, "hum": 2, "bat": 3}')
+
+
+def queued(ingest):
+    return [ingest.queue.get_nowait()[1] for _ in range(ingest.queue.qsize())]
+
+
+def test_drop_oldest_keeps_newest(tmp_path):
+    async def run():
+        ingest = service(tmp_path, "drop-oldest")
+        for i in range(4):
+            ingest.offer(item(i))
+        assert queued(ingest) == [2, 3]
+        assert ingest.counters["dropped"] == 2
+    asyncio.run(run())
+
+
+def test_block_pauses_reading_until_writer_catches_up(tmp_path):
+    async def run():
+        ingest = service(tmp_path, "block")
+        for i in range(3):
+            ingest.offer(item(i))
+        assert ingest.reading_paused and list(ingest.blocked) == [item(2)]
+        assert ingest.queue.get_nowait()[1] == 0
+        ingest.unblock()
+        assert not ingest.reading_paused and not ingest.blocked
+        assert queued(ingest) == [1, 2]
+        assert ingest.counters["dropped"] == 0
+    asyncio.run(run())
+
+
+def test_spill_writes_overflow_and_replays_it(tmp_path):
+    async def run():
+        ingest = service(tmp_path, "spill", queue_size=4)
+        for i in range(6):
+            ingest.offer(item(i))
+        assert ingest.counters["spilled"] == 2
+        ingest.spill_file.flush()
+        with open(ingest.spill_path) as f:
+            assert [json.loads(line)["ts"] for line in f] == [4, 5]
+        assert queued(ingest) == [0, 1, 2, 3]
+
+        replay = asyncio.create_task(ingest.replay_loop())
+        while ingest.queue.qsize() < 2:
+            await asyncio.sleep(0.05)
+        ingest.stopping.set()
+        await replay
+        assert queued(ingest) == [4, 5]
+        assert not os.path.exists(ingest.spill_path) and not os.path.exists(ingest.spill_path + ".replay")
+    asyncio.run(run())
+
+
+def test_dead_writer_stops_the_service(tmp_path):
+    async def run():
+        ingest = service(tmp_path, "block")
+
+        async def fail():
+            raise OSError("disk gone")
+        writer = asyncio.create_task(fail())
+        writer.add_done_callback(ingest.writer_done)
+        await asyncio.wait_for(ingest.stopping.wait(), 1)
+    asyncio.run(run())
@@ -0,0 +1,88 @@
+import sqlite3
+import threading
+import time
+import migrate_db
+from rooms import ROOMS
+
+
+# A database in the layout before any migration: one table per room with the
+# text datetime column only.
+def make_baseline(path, datetimes):
+    conn = sqlite3.connect(path)
+    for room in ROOMS:
+        conn.execute(f"CREATE TABLE {room.table} (datetime TEXT NOT NULL, "
+                     + ", ".join(f"{column} REAL NOT NULL" for column in room.columns) + ")")
+        conn.executemany(f"INSERT INTO {room.table} VALUES (?, {', '.join('?' for column in room.columns)})",
+                         ((text, *(i + n / 10 for n in range(len(room.columns)))) for i, text in enumerate(datetimes)))
+    conn.commit()
+    conn.close()
+
+
+def user_version(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_migrate_waits_for_another_writer(tmp_path):
+    path = str(tmp_path / "data.db")
+    make_baseline(path, ["30/01/24 12:00:00"])
+    other = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE")
+    release = threading.Timer(0.5, lambda: other.execute("COMMIT"))
+    release.start()
+    start = time.monotonic()
+    migrate_db.migrate(path)
+    assert time.monotonic() - start >= 0.4
+    assert user_version(path) == len(migrate_db.migrations)
+
+
+def test_concurrent_migrations_migrate_once(tmp_path):
+    path = str(tmp_path / "data.db")
+    make_baseline(path, [f"{day:02d}/01/24 12:00:00" for day in range(1, 29)] * 50)
+    errors = []
+
+    def run():
+        try:
+            migrate_db.migrate(path)
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=run) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert user_version(path) == len(migrate_db.migrations)
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT count(*) FROM stue_p202401").fetchone()[0] == 28 * 50
+
+
+def test_partitioning_keeps_every_row_across_months(tmp_path):
+    path = str(tmp_path / "data.db")
+    datetimes = ([f"{day:02d}/01/24 {hour:02d}:30:00" for day in (30, 31) for hour in range(24)]
+                 + [f"{day:02d}/02/24 {hour:02d}:30:00" for day in (1, 2) for hour in range(24)])
+    make_baseline(path, datetimes)
+    conn = sqlite3.connect(path)
+    before = {room.name: sorted(conn.execute(f"SELECT * FROM {room.table}").fetchall()) for room in ROOMS}
+    conn.close()
+
+    migrate_db.migrate(path)
+
+    conn = sqlite3.connect(path)
+    for room in ROOMS:
+        tables = [name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                                                 "AND name GLOB ? ORDER BY name", (f"{room.table}_p*",))]
+        assert tables == [f"{room.table}_p202401", f"{room.table}_p202402"]
+        assert not conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (room.table,)).fetchone()
+        columns = ", ".join(["datetime"] + room.columns)
+        after = sorted(row for table in tables for row in conn.execute(f"SELECT {columns} FROM {table}"))
+        assert after == before[room.name]
+        for table in tables:
+            month = int(table[-6:])
+            assert all(month == int(time.strftime("%Y%m", time.gmtime(ts / 1000)))
+                       for ts, in conn.execute(f"SELECT ts FROM {table}"))
+        assert conn.execute(f"SELECT sum(count) FROM {room.table}_1d").fetchone()[0] == len(datetimes)
+    conn.close()
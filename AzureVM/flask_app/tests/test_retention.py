@@ -0,0 +1,46 @@
+import calendar
+import db_writer
+import partitions
+import retention
+from rooms import rooms_by_name
+
+ROOM = rooms_by_name["bedroom"]
+
+
+def ts_of(year, month, day):
+    return calendar.timegm((year, month, day, 12, 0, 0)) * 1000
+
+
+def make_room(path, timestamps):
+    conn = db_writer.connect(path)
+    for ts in timestamps:
+        partition = partitions.partition_for(ROOM, ts)
+        partitions.create(conn, partition)
+        conn.execute(partition.insert_query, (str(ts), ts) + (1.0,) * len(ROOM.columns))
+    conn.commit()
+    return conn
+
+
+def remaining(conn):
+    return {partition.month: [ts for ts, in conn.execute(f"SELECT ts FROM {partition.table} ORDER BY ts")]
+            for partition in partitions.partitions(conn, ROOM)}
+
+
+def test_expire_raw_drops_whole_months_and_trims_the_straddling_one(tmp_path):
+    january = [ts_of(2024, 1, day) for day in range(1, 32)]
+    february = [ts_of(2024, 2, day) for day in range(1, 30)]
+    conn = make_room(str(tmp_path / "data.db"), january + february)
+    cutoff_ts = ts_of(2024, 2, 10) - 12 * 3600 * 1000
+    assert retention.count_expired(conn, ROOM, cutoff_ts) == 31 + 9
+    assert retention.expire_raw(conn, ROOM, cutoff_ts, batch_size=4, pause=0) == 31 + 9
+    assert remaining(conn) == {202402: february[9:]}
+
+
+def test_expire_raw_keeps_the_newest_reading_of_a_quiet_sensor(tmp_path):
+    readings = [ts_of(2024, 1, day) for day in range(1, 11)]
+    conn = make_room(str(tmp_path / "data.db"), readings)
+    cutoff_ts = ts_of(2024, 3, 1)
+    assert retention.count_expired(conn, ROOM, cutoff_ts) == 9
+    assert retention.expire_raw(conn, ROOM, cutoff_ts, batch_size=100, pause=0) == 9
+    assert remaining(conn) == {202401: readings[-1:]}
+    assert partitions.newest_ts(conn, ROOM) == readings[-1]
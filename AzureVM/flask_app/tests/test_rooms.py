@@ -0,0 +1,14 @@
+import pytest
+from rooms import rooms_by_name
+
+room = rooms_by_name["bath"]
+
+
+def test_extract_in_registry_order():
+    assert room.extract({"temp": 21.5, "hum": 40, "bat": 88.0}) == (21.5, 40, 88.0)
+
+
+@pytest.mark.parametrize("bad", [None, True, "err", float("nan"), float("inf")])
+def test_extract_rejects_values_that_are_not_numbers(bad):
+    with pytest.raises(ValueError):
+        room.extract({"temp": bad, "hum": 40, "bat": 88.0})
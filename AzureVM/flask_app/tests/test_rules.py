@@ -0,0 +1,37 @@
+import pytest
+from rules import Actuator, Rule, RuleEngine
+
+
+def engine(min_on=0):
+    fan = Actuator("fan", "test/fan", min_on=min_on)
+    rule = Rule.band("humidity", "fan", "stue", "humidity", off_below=30, on_above=50)
+    return RuleEngine(rules=[rule], actuators=[fan]), fan
+
+
+def test_band_switches_on_above_and_off_below():
+    rules, fan = engine()
+    assert [state for actuator, state, rule in rules.on_reading("stue", {"humidity": 55}, now=0)] == [True]
+    assert rules.on_reading("stue", {"humidity": 40}, now=1) == []
+    assert fan.state is True
+    assert [state for actuator, state, rule in rules.on_reading("stue", {"humidity": 25}, now=2)] == [False]
+
+
+def test_band_has_no_opinion_inside_band():
+    rule = Rule.band("humidity", "fan", "stue", "humidity", off_below=30, on_above=50)
+    rule.evaluate({("stue", "humidity"): 40})
+    assert rule.vote is None
+    rule.evaluate({("stue", "humidity"): 50.5})
+    assert rule.vote is True
+
+
+def test_band_requires_off_below_on():
+    with pytest.raises(ValueError):
+        Rule.band("humidity", "fan", "stue", "humidity", off_below=50, on_above=30)
+
+
+def test_min_on_holds_until_tick():
+    rules, fan = engine(min_on=60)
+    rules.on_reading("stue", {"humidity": 55}, now=0)
+    assert rules.on_reading("stue", {"humidity": 25}, now=10) == []
+    assert rules.tick(now=30) == []
+    assert [state for actuator, state, rule in rules.tick(now=61)] == [False]
@@ -42,16 +42,23 @@ async def messages(client):  # Respond to incoming messages
             value = int(msg)
         except:
             print("Error converting message to integer")
+            continue                                    # Ugyldig besked, blæseren beholder sin tilstand
         if value > 0:
             fan.duty(1023)
         elif value < 1:
             fan.duty(0)
+        await publish_fan_state(client)                 # Bekræft den nye tilstand over for serveren
+
+async def publish_fan_state(client):  # Fortæller serveren om blæseren kører ('1') eller er slukket ('0')
+    state = '1' if fan.duty() > 0 else '0'
+    await client.publish('sensor/stue/fan/state', state, retain=True, qos=1)   # retain, så nye klienter får tilstanden med det samme
 
 async def up(client):  # Respond to connectivity being (re)established
     while True:
         await client.up.wait()  # Wait on an Event, næste linje bliver først kørt når "up event" er sket
         client.up.clear()       # Clear the event. Ingen andre tasks venter på "up"-funktionen.
         await client.subscribe('sensor/stue/fan', 1)  # renew subscriptions
+        await publish_fan_state(client)               # Send blæserens tilstand efter (gen)forbindelse
 
 async def main(client): #### Primært loop hvor alt det vigtige sker. Først forbindes der til wifi og MQTT, derefter startes coroutines. Til sidst startes main while-loop. ####
     try:                                        # Prøver at forbinde til wifi og MQTT broker,
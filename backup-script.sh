@@ -1,19 +1,31 @@
 #!/usr/bin/env sh
 
 # Mapper
-sourcedir="test"
-zipname="backup.zip"
+appdir="AzureVM/flask_app"
+dbpath="database/data.db"
+backupdir="backup"
+keep=30
 rclone_dest="azure:backup"
 
+# Incremental backup: backup.py stores a consistent snapshot of the database
+# as content-addressed chunks in $backupdir, where only chunks with changed
+# pages are new. Chunks are never rewritten, so rclone copy only uploads the
+# new ones instead of a fresh zip of everything. Pruning only frees space in
+# $backupdir; the remote keeps every chunk it has received.
+#
+# Restore: rclone copy "$rclone_dest" "$backupdir"
+#          python3 backup.py --target "$backupdir" restore --out restored.db
+
+set -e
 
 echo " **   Starting backup script ** "
 echo " **   Testing connection to Azure... **"
 rclone lsd "$rclone_dest"
 
-echo " **   Zipping files"
-
-# Delete zip if it already exists
-rm "$zipname"
-zip -r "$zipname" "$sourcedir"
+echo " **   Taking snapshot"
+cd "$appdir"
+python3 backup.py --target "$backupdir" backup --db "$dbpath"
+python3 backup.py --target "$backupdir" prune --keep "$keep"
 
-rclone copy "$zipname" azure:backup
+echo " **   Uploading new chunks"
+rclone copy "$backupdir" "$rclone_dest"